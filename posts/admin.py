@@ -1,6 +1,11 @@
 from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 
-from .models import Group, Post, Comment
+from . import search
+from .models import Group, Post, Comment, ProfileRecord
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +14,11 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.available():
+            return super().get_search_results(request, queryset, search_term)
+        return search.filter_matching(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title')
@@ -19,6 +29,45 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ('pk', 'text', 'author', 'created', 'post')
 
 
+class ProfileRecordAdmin(admin.ModelAdmin):
+    list_display = ('created', 'method', 'path', 'view', 'kind', 'status', 'duration_ms', 'queries', 'user', 'download')
+    list_filter = ('kind', 'view')
+    search_fields = ('path',)
+    fields = ('created', 'user', 'method', 'path', 'view', 'kind', 'status', 'duration_ms', 'queries', 'download', 'report')
+    readonly_fields = fields
+    empty_value_display = '-пусто-'
+
+    def has_add_permission(self, request):
+        return False
+
+    def download(self, obj):
+        url = reverse('admin:posts_profilerecord_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.filename)
+    download.short_description = 'файл'
+
+    def report(self, obj):
+        return format_html('<pre>{}</pre>', obj.summary)
+    report.short_description = 'отчёт'
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='posts_profilerecord_download',
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        record = get_object_or_404(ProfileRecord, pk=pk)
+        if not self.has_view_permission(request, record):
+            return HttpResponse(status=403)
+        response = HttpResponse(bytes(record.data), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{record.filename}"'
+        return response
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.register(ProfileRecord, ProfileRecordAdmin)
@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import condition
+
+from . import comments as post_comments, search as post_search, timeline
+from .conditional import feed_etag, feed_last_modified, post_last_modified, resource_etag
+from .models import Group, Post, User
+from .paginator import FEED_ORDERING, page_number, paginate, paginate_sources
+
+
+# Поле ответа -> колонка .values().
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comment_count': 'comment_count',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'author': 'author__username',
+    'text': 'text',
+    'created': 'created',
+}
+FEED_ORDERING_COLUMNS = [name.lstrip('-') for name in FEED_ORDERING]
+CONVERTERS = {
+    'image': lambda name: default_storage.url(name) if name else None,
+}
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def selected_fields(request, fields):
+    """Поля из ?fields=a,b или все поля ресурса; None, если есть неизвестные."""
+    names = [name for name in request.GET.get('fields', '').split(',') if name] or list(fields)
+    return names if set(names) <= set(fields) else None
+
+
+def columns(fields, names, required):
+    return list(dict.fromkeys([*required, *(fields[name] for name in names)]))
+
+
+def serialize(row, fields, names):
+    result = {}
+    for name in names:
+        value = row[fields[name]]
+        result[name] = CONVERTERS[name](value) if name in CONVERTERS else value
+    return result
+
+
+def page_size(request):
+    if 'limit' not in request.GET:
+        return settings.API_PAGE_SIZE
+    return min(page_number(request.GET['limit']), settings.API_MAX_PAGE_SIZE)
+
+
+def page_response(page, fields, names):
+    return JsonResponse({
+        'results': [serialize(row, fields, names) for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def post_feed(request, posts):
+    names = selected_fields(request, POST_FIELDS)
+    if names is None:
+        return error('Неизвестное поле в fields', 400)
+    rows = posts.values(*columns(POST_FIELDS, names, FEED_ORDERING_COLUMNS))
+    _, page = paginate(request, rows, page_size(request))
+    return page_response(page, POST_FIELDS, names)
+
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+def index(request):
+    return post_feed(request, Post.objects.all())
+
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+def group(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list('id', flat=True).first()
+    if group_id is None:
+        return error('Группа не найдена', 404)
+    return post_feed(request, Post.objects.filter(group_id=group_id))
+
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+def profile(request, username):
+    author_id = User.objects.filter(username=username).values_list('id', flat=True).first()
+    if author_id is None:
+        return error('Пользователь не найден', 404)
+    return post_feed(request, Post.objects.filter(author_id=author_id))
+
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+def follow(request):
+    if not request.user.is_authenticated:
+        return error('Требуется вход', 401)
+    names = selected_fields(request, POST_FIELDS)
+    if names is None:
+        return error('Неизвестное поле в fields', 400)
+    sources = timeline.sources(request.user, columns(POST_FIELDS, names, FEED_ORDERING_COLUMNS))
+    _, page = paginate_sources(request, sources, page_size(request))
+    return page_response(page, POST_FIELDS, names)
+
+
+@condition(etag_func=resource_etag, last_modified_func=post_last_modified)
+def post(request, post_id):
+    names = selected_fields(request, POST_FIELDS)
+    if names is None:
+        return error('Неизвестное поле в fields', 400)
+    row = Post.objects.filter(pk=post_id).values(*columns(POST_FIELDS, names, [])).first()
+    if row is None:
+        return error('Пост не найден', 404)
+    return JsonResponse(serialize(row, POST_FIELDS, names))
+
+
+@condition(etag_func=resource_etag, last_modified_func=post_last_modified)
+def comments(request, post_id):
+    names = selected_fields(request, COMMENT_FIELDS)
+    if names is None:
+        return error('Неизвестное поле в fields', 400)
+    if not Post.objects.filter(pk=post_id).exists():
+        return error('Пост не найден', 404)
+    ordering = post_comments.COMMENT_ORDERING
+    rows = post_comments.for_post(post_id).values(*columns(COMMENT_FIELDS, names, ordering))
+    _, page = paginate(request, rows, page_size(request), ordering)
+    return page_response(page, COMMENT_FIELDS, names)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    if not post_search.available():
+        return JsonResponse({'error': 'Полнотекстовый поиск недоступен'}, status=501)
+
+    rows, next_cursor = post_search.search(query, request.GET.get('after'), page_size(request)) if query else ([], None)
+    posts = Post.objects.filter(pk__in=[pk for pk, _ in rows]).values(
+        'id', 'text', 'pub_date', 'author__username', 'group__slug'
+    )
+    found = {post['id']: post for post in posts}
+
+    results = []
+    for pk, rank in rows:
+        post = found.get(pk)
+        if post is None:
+            continue
+        results.append({
+            'id': post['id'],
+            'text': post['text'],
+            'pub_date': post['pub_date'],
+            'author': post['author__username'],
+            'group': post['group__slug'],
+            'rank': rank,
+            'url': reverse('post', kwargs={'username': post['author__username'], 'post_id': post['id']}),
+        })
+
+    return JsonResponse({'query': query, 'results': results, 'next': next_cursor})
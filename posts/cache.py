@@ -0,0 +1,135 @@
+import hashlib
+import math
+import random
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+
+
+# Значение в кэше вместе с мягким сроком годности и временем его расчёта.
+Entry = namedtuple('Entry', ('value', 'expires', 'delta'))
+
+
+def generation_key(name):
+    return f'posts:generation:{name}'
+
+
+def generation(name='feed'):
+    """Текущее поколение кэша name.
+
+    Начальное значение берётся от времени, а не с единицы: если счётчик
+    вытеснят из кэша, старые фрагменты с совпадающим поколением не оживут.
+    """
+    key = generation_key(name)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def bump(name='feed'):
+    key = generation_key(name)
+    # Время сброса пишется до нового поколения: кто видит новое поколение,
+    # видит и время, по которому ReplicaMiddleware решает, можно ли читать с реплик.
+    cache.set(f'{key}:changed', time.time(), None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счётчик вытеснен: заводим его заново от времени и увеличиваем,
+        # чтобы incr разослал смену поколения и другим процессам.
+        cache.add(key, time.time_ns(), None)
+        cache.incr(key)
+
+
+def changed_at(name='feed'):
+    """Время последнего сброса поколения name или None, если оно неизвестно."""
+    return cache.get(f'{generation_key(name)}:changed')
+
+
+def card_key(post, card_generation):
+    """Ключ общей для всех читателей части карточки поста.
+
+    Меняется при правке поста (modified), новом комментарии и появлении
+    готовой миниатюры; поколение 'card' сбрасывают правки групп и авторов.
+    Хэш текста ловит правки мимо save(), например QuerySet.update, которые
+    modified не трогают.
+    """
+    try:
+        thumbnail = post.thumbnail
+    except ObjectDoesNotExist:
+        thumbnail = None
+    thumbnail_ready = bool(post.image) and thumbnail is not None and thumbnail.source == post.image.name
+    text = hashlib.md5(post.text.encode()).hexdigest()[:8]
+    return (
+        f'posts:card:{card_generation}:{post.pk}:{post.modified.timestamp()}:{post.comment_count}:'
+        f'{thumbnail_ready:d}:{text}'
+    )
+
+
+def feed_cache_context():
+    return {'cache_generation': generation(), 'cache_timeout': settings.FEED_CACHE_TIMEOUT}
+
+
+def expiring(entry):
+    """Пора ли пересчитать entry заранее (XFetch).
+
+    Вероятность растёт к сроку годности и тем быстрее, чем дольше
+    значение считалось, так что воркеры обновляют горячий ключ по одному,
+    а не все разом в момент истечения.
+    """
+    early = -entry.delta * settings.CACHE_EARLY_BETA * math.log(1 - random.random())
+    return time.time() + early >= entry.expires
+
+
+def fetch(key, compute, timeout, stale_key=None, store=None, allow_stale=True):
+    """Значение key из кэша или compute() с защитой от лавины пересчётов.
+
+    Пересчитывает только тот, кто взял блокировку key через cache.add;
+    остальные в это время получают прежнее значение key или, если key
+    новый (сменилось поколение), последнее значение stale_key. Значения
+    живут в кэше на CACHE_STALE_TIMEOUT дольше своего срока, чтобы было
+    что отдать. С allow_stale=False просроченное не отдаётся, но stale_key
+    всё равно обновляется. store(value) может запретить сохранять результат.
+
+    Возвращает пару (значение, состояние): 'hit', 'stale', 'miss' или
+    'bypass', если результат не сохранён.
+    """
+    entry = cache.get(key)
+    if not isinstance(entry, Entry):
+        entry = None
+    if entry is not None and not expiring(entry):
+        return entry.value, 'hit'
+
+    lock = f'{key}:lock'
+    locked = cache.add(lock, True, settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        # Досрочный пересчёт уже идёт, а срок значения ещё не вышел.
+        if entry is not None and entry.expires > time.time():
+            return entry.value, 'hit'
+        if allow_stale:
+            if entry is None and stale_key is not None:
+                entry = cache.get(stale_key)
+            if isinstance(entry, Entry):
+                return entry.value, 'stale'
+        # Отдать нечего: считаем сами, как без защиты.
+
+    try:
+        started = time.perf_counter()
+        value = compute()
+        delta = time.perf_counter() - started
+        if store is not None and not store(value):
+            return value, 'bypass'
+        entry = Entry(value, time.time() + timeout, delta)
+        cache.set_many(
+            {key: entry, **({stale_key: entry} if stale_key else {})}, timeout + settings.CACHE_STALE_TIMEOUT
+        )
+        return value, 'miss'
+    finally:
+        if locked:
+            # Снимаем блокировку записью с нулевым сроком, а не delete: delete
+            # двухуровневого кэша сбрасывает L1 во всех процессах.
+            cache.set(lock, False, 0)
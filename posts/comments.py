@@ -0,0 +1,33 @@
+from django.conf import settings
+
+from .models import Comment
+from .paginator import Source, cursor_values, decode_cursor, encode_cursor, window
+
+
+COMMENT_ORDERING = ('created', 'id')
+
+
+def for_post(post_id):
+    return Comment.objects.filter(post_id=post_id).select_related('author').order_by(*COMMENT_ORDERING)
+
+
+def first_page(post):
+    """Первая порция комментариев поста.
+
+    Возвращает пару (QuerySet, курсор следующей порции или None). QuerySet
+    уже выполнен, шаблон не повторит запрос. Есть ли продолжение, видно
+    по счётчику comment_count без лишнего запроса.
+    """
+    comments = for_post(post.pk)[:settings.COMMENTS_PER_PAGE]
+    rows = list(comments)
+    more = rows and post.comment_count > len(rows)
+    return comments, encode_cursor(cursor_values(rows[-1], COMMENT_ORDERING)) if more else None
+
+
+def after(post_id, token):
+    """Порция комментариев после курсора token: пара (список, курсор или None)."""
+    per_page = settings.COMMENTS_PER_PAGE
+    values = decode_cursor(token, Comment, COMMENT_ORDERING) if token else None
+    rows = window(Source(for_post(post_id), COMMENT_ORDERING), values, False, 0, per_page + 1)
+    next_cursor = encode_cursor(rows[per_page - 1][0]) if len(rows) > per_page else None
+    return [row for _, row in rows[:per_page]], next_cursor
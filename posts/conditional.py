@@ -0,0 +1,67 @@
+import hashlib
+from datetime import datetime, timezone
+
+from django.middleware.csrf import get_token
+
+from .cache import changed_at, generation
+from .models import Post
+
+
+def digest(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def post_state(request, post_id, username=None):
+    # etag_func и last_modified_func вызываются по очереди: читаем строку один раз.
+    if not hasattr(request, '_post_state'):
+        posts = Post.objects.filter(pk=post_id)
+        if username is not None:
+            posts = posts.filter(author__username=username)
+        rows = posts.order_by().values_list(
+            'modified', 'comment_count',
+            'author__stats__followers', 'author__stats__following', 'author__stats__posts', 'author__stats__updated',
+        )[:1]
+        request._post_state = rows[0] if rows else None
+    return request._post_state
+
+
+def state_etag(request, post_id, username=None):
+    state = post_state(request, post_id, username)
+    return digest(request.user.pk, *state) if state else None
+
+
+def post_etag(request, post_id, username=None):
+    """ETag страницы поста.
+
+    Вошедшему пользователю страница показывает форму комментария с
+    CSRF-токеном: после нового входа токен другой, и закэшированная в
+    браузере форма уже не отправится.
+    """
+    etag = state_etag(request, post_id, username)
+    if etag is None or not request.user.is_authenticated:
+        return etag
+    # get_token солит токен заново при каждом вызове, а cookie за ним постоянна.
+    get_token(request)
+    return digest(etag, request.META['CSRF_COOKIE'])
+
+
+def post_last_modified(request, post_id, username=None):
+    state = post_state(request, post_id, username)
+    if not state:
+        return None
+    return max(moment for moment in (state[0], state[-1]) if moment is not None)
+
+
+def resource_etag(request, post_id, username=None):
+    """ETag поста для API: зависит ещё и от строки запроса (?fields=, курсор)."""
+    etag = state_etag(request, post_id, username)
+    return etag and digest(etag, request.get_full_path())
+
+
+def feed_etag(request, *args, **kwargs):
+    return digest(generation('page'), request.get_full_path(), request.user.pk)
+
+
+def feed_last_modified(request, *args, **kwargs):
+    moment = changed_at('page')
+    return datetime.fromtimestamp(moment, tz=timezone.utc) if moment else None
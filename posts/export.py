@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+import zlib
+
+from .models import Comment, Follow, Group, Post, User
+
+
+# Таблица -> (модель, поле записи -> колонка .values()). Формат записей
+# совпадает с тем, что читает import_yatube.
+TABLES = {
+    'user': (User, {'username': 'username', 'first_name': 'first_name', 'last_name': 'last_name', 'email': 'email'}),
+    'group': (Group, {'slug': 'slug', 'title': 'title', 'description': 'description'}),
+    'post': (Post, {
+        'id': 'id', 'author': 'author__username', 'group': 'group__slug', 'text': 'text',
+        'pub_date': 'pub_date', 'image': 'image', 'comment_count': 'comment_count',
+    }),
+    'comment': (Comment, {
+        'id': 'id', 'post': 'post_id', 'author': 'author__username', 'text': 'text', 'created': 'created',
+    }),
+    'follow': (Follow, {'user': 'user__username', 'author': 'author__username'}),
+}
+DEFAULT_TABLES = ('post', 'comment', 'follow')
+CHUNK_SIZE = 2000
+
+
+def isoformat(value):
+    # DjangoJSONEncoder округляет время до миллисекунд, выгрузка должна быть точной.
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def table_records(table, chunk_size=CHUNK_SIZE):
+    """Записи таблицы порциями по первичному ключу: память не зависит от размера таблицы."""
+    model, fields = TABLES[table]
+    columns = list(dict.fromkeys(['id', *fields.values()]))
+    last_pk = 0
+    while True:
+        rows = list(model.objects.filter(pk__gt=last_pk).order_by('pk').values(*columns)[:chunk_size])
+        if not rows:
+            return
+        last_pk = rows[-1]['id']
+        for row in rows:
+            yield {'type': table, **{name: row[column] for name, column in fields.items()}}
+
+
+def records(tables, chunk_size=CHUNK_SIZE):
+    for table in tables:
+        yield from table_records(table, chunk_size)
+
+
+def fieldnames(tables):
+    return list(dict.fromkeys(['type', *(name for table in tables for name in TABLES[table][1])]))
+
+
+def encode(tables, data_format, chunk_size=CHUNK_SIZE):
+    """Текст выгрузки кусками по chunk_size записей."""
+    buffer = io.StringIO()
+    if data_format == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames(tables))
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(record):
+            buffer.write(json.dumps(record, default=isoformat, ensure_ascii=False))
+            buffer.write('\n')
+
+    for number, record in enumerate(records(tables, chunk_size), 1):
+        write(record)
+        if number % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzipped(parts):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for part in parts:
+        data = compressor.compress(part.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parse_tables(value):
+    """Список таблиц из строки 'post,comment'; None, если есть неизвестные."""
+    tables = [table for table in (value or '').split(',') if table] or list(DEFAULT_TABLES)
+    return tables if set(tables) <= set(TABLES) else None
@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from posts.cache import bump
+from posts.models import Follow, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность JSON API и HTML-страниц для лент, постов и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--user', help='Читатель для ленты подписок; по умолчанию первый подписчик')
+        parser.add_argument('--cold', action='store_true', help='Сбрасывать кэш страниц и фрагментов перед каждым запросом')
+
+    def handle(self, *args, repeat, user, cold, **options):
+        reader = User.objects.get(username=user) if user else self.default_reader()
+        client = Client()
+        if reader is not None:
+            client.force_login(reader)
+
+        self.stdout.write(f'{"страница":<12}{"формат":<8}{"зап/с":>10}{"p50, мс":>10}{"p95, мс":>10}{"байт":>10}')
+        for name, html_url, api_url in self.urls(reader):
+            for kind, url in (('html', html_url), ('json', api_url)):
+                timings, size = self.measure(client, url, repeat, cold)
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(
+                    f'{name:<12}{kind:<8}{1000 * len(timings) / sum(timings):>10.1f}'
+                    f'{statistics.median(timings):>10.2f}{p95:>10.2f}{size:>10}'
+                )
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def default_reader(self):
+        follow = Follow.objects.order_by('pk').first()
+        return follow.user if follow else User.objects.order_by('pk').first()
+
+    def measure(self, client, url, repeat, cold):
+        timings, size = [], 0
+        for _ in range(repeat):
+            if cold:
+                bump('feed')
+                bump('page')
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            size = len(response.content)
+        timings.sort()
+        return timings, size
+
+    def urls(self, reader):
+        yield 'index', reverse('index'), reverse('api_index')
+        if reader is not None:
+            yield 'follow', reverse('follow_index'), reverse('api_follow')
+
+        group = Group.objects.order_by('pk').first()
+        if group:
+            yield 'group', reverse('group', kwargs={'slug': group.slug}), reverse('api_group', kwargs={'slug': group.slug})
+
+        post = Post.objects.select_related('author').order_by('-comment_count', 'pk').first()
+        if post:
+            username = post.author.username
+            yield 'profile', reverse('profile', kwargs={'username': username}), \
+                reverse('api_profile', kwargs={'username': username})
+            yield 'post', reverse('post', kwargs={'username': username, 'post_id': post.id}), \
+                reverse('api_post', kwargs={'post_id': post.id})
+            yield 'comments', reverse('comments', kwargs={'username': username, 'post_id': post.id}), \
+                reverse('api_comments', kwargs={'post_id': post.id})
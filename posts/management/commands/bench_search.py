@@ -0,0 +1,40 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость поиска по индексу FTS5 и через LIKE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=['привет', 'котики', 'тестовый пост'])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, queries, repeat, limit, **options):
+        if not search.available():
+            raise CommandError('Индекс FTS5 доступен только в SQLite')
+
+        self.stdout.write(f'Постов в базе: {Post.objects.count()}')
+        self.stdout.write(f'{"запрос":<24}{"путь":<8}{"p50, мс":>10}{"p95, мс":>10}{"найдено":>10}')
+        for query in queries:
+            for name, run in (('fts', self.fts), ('like', self.like)):
+                timings, found = [], 0
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    found = run(query, limit)
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(f'{query:<24}{name:<8}{statistics.median(timings):>10.2f}{p95:>10.2f}{found:>10}')
+
+    def fts(self, query, limit):
+        rows, _ = search.search(query, limit=limit)
+        return len(list(Post.objects.filter(pk__in=[pk for pk, _ in rows])))
+
+    def like(self, query, limit):
+        return len(list(Post.objects.filter(text__icontains=query).order_by('-pub_date', '-id')[:limit]))
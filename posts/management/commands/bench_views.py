@@ -0,0 +1,209 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+ROUTES = (
+    'index', 'group', 'profile', 'post', 'comments', 'follow_index', 'search', 'api_index',
+    'add_comment', 'new_post', 'profile_follow', 'profile_unfollow',
+)
+# Маршруты, которые пишут в базу: каждый их запрос откатывается, чтобы
+# прогоны шли на одних и тех же данных и были сравнимы между собой.
+WRITES = ('add_comment', 'new_post', 'profile_follow', 'profile_unfollow')
+
+
+def percentile(timings, share):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    return timings[min(len(timings) - 1, max(int(round(share * len(timings))) - 1, 0))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает маршруты posts тестовым клиентом в несколько потоков и сохраняет '
+        'p50/p95/p99, пропускную способность и число запросов к базе в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('routes', nargs='*', help=f'По умолчанию все: {", ".join(ROUTES)}')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на маршрут')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--warmup', type=int, default=5, help='Неучитываемых запросов на маршрут')
+        parser.add_argument('--user', help='Читатель; по умолчанию пользователь с наибольшим числом подписок')
+        parser.add_argument('--anonymous', action='store_true', help='Читать страницы без входа (через кэш страниц)')
+        parser.add_argument('--output', help='Файл JSON с результатами')
+        parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения p50')
+
+    def handle(self, *args, routes, requests, concurrency, warmup, user, anonymous, output, baseline, **options):
+        unknown = set(routes) - set(ROUTES)
+        if unknown:
+            raise CommandError(f'Неизвестные маршруты: {", ".join(sorted(unknown))}')
+        self.reader = User.objects.get(username=user) if user else self.default_reader()
+        if self.reader is None:
+            raise CommandError('В базе нет пользователей: сначала выполните seed_yatube')
+        self.anonymous = anonymous
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.targets = self.targets_for(self.reader)
+        previous = self.load(baseline)
+
+        results = {}
+        for name in routes or ROUTES:
+            request = self.request_for(name)
+            if request is None:
+                self.stderr.write(f'{name}: нет данных, пропускаем')
+                continue
+            for _ in range(warmup):
+                self.call(name, request)
+            results[name] = self.run(name, request, requests, concurrency)
+            self.report(name, results[name], previous.get(name))
+
+        run = {
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'requests': requests,
+            'concurrency': concurrency,
+            'anonymous': anonymous,
+            'database': settings.DATABASES['default']['ENGINE'],
+            'dataset': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+            'routes': results,
+        }
+        if output:
+            with open(output, 'w') as stream:
+                json.dump(run, stream, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {output}'))
+
+    def default_reader(self):
+        return User.objects.annotate(total=Count('follower')).order_by('-total', 'pk').first()
+
+    def targets_for(self, reader):
+        post = Post.objects.select_related('author').order_by('-comment_count', 'pk').first()
+        author = Follow.objects.filter(user=reader).values_list('author__username', flat=True).first()
+        stranger = User.objects.exclude(pk=reader.pk).exclude(following__user=reader).order_by('pk').first()
+        return {
+            'post': post,
+            'group': Group.objects.order_by('pk').first(),
+            'author': author or (post and post.author.username),
+            'stranger': stranger,
+        }
+
+    def request_for(self, name):
+        """Тройка (метод, адрес, данные) для маршрута name или None, если данных нет."""
+        post, group, author, stranger = (self.targets[key] for key in ('post', 'group', 'author', 'stranger'))
+        post_kwargs = post and {'username': post.author.username, 'post_id': post.id}
+        requests = {
+            'index': ('get', reverse('index'), None),
+            'follow_index': ('get', reverse('follow_index'), None),
+            'search': ('get', reverse('search'), {'q': 'котики'}),
+            'api_index': ('get', reverse('api_index'), None),
+            'new_post': ('post', reverse('new_post'), {'text': 'Пост из нагрузочного теста'}),
+            'group': group and ('get', reverse('group', kwargs={'slug': group.slug}), None),
+            'profile': author and ('get', reverse('profile', kwargs={'username': author}), None),
+            'post': post and ('get', reverse('post', kwargs=post_kwargs), None),
+            'comments': post and ('get', reverse('comments', kwargs=post_kwargs), None),
+            'add_comment': post and (
+                'post', reverse('add_comment', kwargs=post_kwargs), {'text': 'Комментарий из нагрузочного теста'}
+            ),
+            'profile_follow': stranger and (
+                'get', reverse('profile_follow', kwargs={'username': stranger.username}), None
+            ),
+            'profile_unfollow': stranger and (
+                'get', reverse('profile_unfollow', kwargs={'username': stranger.username}), None
+            ),
+        }
+        return requests[name] or None
+
+    def client(self):
+        # Клиент и соединение с базой у каждого потока свои.
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+            if not self.anonymous:
+                self.local.client.force_login(self.reader)
+        return self.local.client
+
+    def call(self, name, request):
+        if name not in WRITES:
+            return self.measure(request)
+        # SQLite не повышает до записи две открытые транзакции сразу и отвечает
+        # «database is locked»; записи в нём и так идут по одной.
+        with self.write_lock if connection.vendor == 'sqlite' else nullcontext():
+            # Вход пользователя клиента не должен попасть в откатываемую транзакцию.
+            self.client()
+            with transaction.atomic():
+                if name == 'profile_unfollow':
+                    # Отписка замеряется от существующей подписки, а не вхолостую.
+                    Follow.objects.get_or_create(user=self.reader, author=self.targets['stranger'])
+                result = self.measure(request)
+                transaction.set_rollback(True)
+        return result
+
+    def measure(self, request):
+        method, url, data = request
+        client = self.client()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            try:
+                status = getattr(client, method)(url, data).status_code
+            except Exception:
+                # Тестовый клиент пробрасывает исключения вида; для замера это ответ 500.
+                status = 500
+            elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, len(queries), status
+
+    def run(self, name, request, requests, concurrency):
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(lambda _: self.call(name, request), range(requests)))
+        else:
+            samples = [self.call(name, request) for _ in range(requests)]
+        wall = time.perf_counter() - started
+
+        timings = sorted(elapsed for elapsed, _, _ in samples)
+        return {
+            'url': request[1],
+            'method': request[0].upper(),
+            'requests': requests,
+            'errors': sum(status >= 400 for _, _, status in samples),
+            'p50_ms': round(percentile(timings, 0.50), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'throughput_rps': round(requests / wall, 1),
+            'queries_per_request': round(statistics.mean(count for _, count, _ in samples), 2),
+        }
+
+    def report(self, name, result, previous):
+        line = (
+            f'{name:<18}p50 {result["p50_ms"]:>8.2f}  p95 {result["p95_ms"]:>8.2f}  p99 {result["p99_ms"]:>8.2f} мс  '
+            f'{result["throughput_rps"]:>8.1f} зап/с  {result["queries_per_request"]:>6.1f} SQL'
+        )
+        if previous:
+            change = (result['p50_ms'] / previous['p50_ms'] - 1) * 100 if previous['p50_ms'] else 0
+            line += f'  p50 {change:+.0f}%'
+        if result['errors']:
+            line += f'  ошибок: {result["errors"]}'
+        self.stdout.write(line)
+
+    def load(self, baseline):
+        if not baseline:
+            return {}
+        with open(baseline) as stream:
+            return json.load(stream)['routes']
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post, User
+
+
+def is_problem(line):
+    if 'USE TEMP B-TREE' in line:
+        return True
+    return line.startswith('SCAN') and 'USING' not in line and 'CONSTANT ROW' not in line
+
+
+class Command(BaseCommand):
+    help = 'Печатает EXPLAIN QUERY PLAN для запросов каждой ленты и отмечает сортировки и полные проходы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Пользователь для страниц, требующих входа; по умолчанию первый подписчик')
+
+    def handle(self, *args, user, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN поддерживается только для SQLite')
+
+        reader = User.objects.get(username=user) if user else self.default_reader()
+        client = Client()
+        if reader is not None:
+            client.force_login(reader)
+
+        problems = 0
+        for name, url in self.urls():
+            with CaptureQueriesContext(connection) as queries:
+                client.get(url)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {url}'))
+            for query in queries:
+                if not query['sql'].startswith('SELECT') or 'django_session' in query['sql']:
+                    continue
+                problems += self.explain(query['sql'])
+
+        if problems:
+            self.stdout.write(self.style.WARNING(f'Сортировок и полных проходов: {problems}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Все запросы лент идут по индексам'))
+
+    def default_reader(self):
+        follow = Follow.objects.order_by('pk').first()
+        return follow.user if follow else User.objects.order_by('pk').first()
+
+    def urls(self):
+        yield 'index', reverse('index')
+        yield 'follow_index', reverse('follow_index')
+
+        group = Group.objects.order_by('pk').first()
+        if group:
+            yield 'group', reverse('group', kwargs={'slug': group.slug})
+
+        post = Post.objects.select_related('author').order_by('pk').first()
+        if post:
+            yield 'profile', reverse('profile', kwargs={'username': post.author.username})
+            yield 'post', reverse('post', kwargs={'username': post.author.username, 'post_id': post.id})
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+
+        self.stdout.write(f'  {sql[:200]}')
+        problems = 0
+        for line in plan:
+            bad = is_problem(line)
+            problems += bad
+            self.stdout.write(self.style.ERROR(f'    ! {line}') if bad else f'      {line}')
+        return problems
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает посты, комментарии и подписки в JSONL или CSV, при необходимости сжимая gzip'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tables', default=','.join(export.DEFAULT_TABLES),
+            help=f'Через запятую из: {", ".join(export.TABLES)}'
+        )
+        parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+        parser.add_argument('--output', default='-', help='Файл; по умолчанию стандартный вывод')
+        parser.add_argument('--gzip', action='store_true', dest='compress', help='Сжать gzip; включается сам для файла .gz')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, tables, format, output, compress, chunk_size, **options):
+        table_names = export.parse_tables(tables)
+        if table_names is None:
+            raise CommandError(f'Неизвестная таблица в {tables!r}')
+
+        parts = export.encode(table_names, format, chunk_size)
+        if compress or output.endswith('.gz'):
+            parts = export.gzipped(parts)
+        else:
+            parts = (part.encode() for part in parts)
+
+        stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        written = 0
+        try:
+            for part in parts:
+                stream.write(part)
+                written += len(part)
+        finally:
+            if output == '-':
+                stream.flush()
+            else:
+                stream.close()
+
+        # При выводе в stdout отчёт не должен попасть в данные.
+        report = self.stderr if output == '-' else self.stdout
+        report.write(self.style.SUCCESS(f'Выгружено таблиц: {len(table_names)}, байт: {written}'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры для постов, у которых их нет или они устарели'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', dest='regenerate', help='Пересоздать миниатюры всех постов с картинками'
+        )
+
+    def handle(self, *args, regenerate, **options):
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if not regenerate:
+            posts = posts.filter(Q(thumbnail__isnull=True) | ~Q(thumbnail__source=F('image')))
+
+        # thumbnails.run закрывает соединение после задачи (она для фонового пула),
+        # поэтому здесь generate вызывается напрямую, а открытый курсор не рвётся.
+        done = failed = 0
+        for post_id in posts.order_by('pk').values_list('pk', flat=True).iterator():
+            try:
+                thumbnails.generate(post_id)
+            except Exception as error:
+                self.stderr.write(f'Пост {post_id}: {error}')
+                failed += 1
+            else:
+                done += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Обработано постов: {done}, с ошибками: {failed}'))
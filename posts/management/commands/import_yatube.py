@@ -0,0 +1,304 @@
+import csv
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import search
+from posts.cache import bump
+from posts.models import Comment, Follow, Group, ImportedPost, ImportSource, Post, User
+
+
+KINDS = ('user', 'group', 'post', 'comment', 'follow')
+REQUIRED = {
+    'user': ('username',),
+    'group': ('slug',),
+    'post': ('author', 'text'),
+    'comment': ('post', 'author', 'text'),
+    'follow': ('user', 'author'),
+}
+# Ограничение SQLite на число параметров в запросе.
+LOOKUP_CHUNK = 500
+
+
+def chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def read_records(path, data_format):
+    if path == '-':
+        stream = sys.stdin
+    elif path.endswith('.gz'):
+        stream = gzip.open(path, 'rt', encoding='utf-8', newline='')
+    else:
+        stream = open(path, encoding='utf-8', newline='')
+    try:
+        if data_format == 'csv':
+            for row in csv.DictReader(stream):
+                yield {key: value for key, value in row.items() if value != ''}
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def parse_moment(value):
+    if not value:
+        return timezone.now()
+    moment = parse_datetime(value)
+    if moment is None:
+        raise CommandError(f'Не удалось разобрать дату {value!r}')
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+@contextmanager
+def preserve_timestamps():
+    """Отключает auto_now и auto_now_add, чтобы bulk_create сохранил даты из файла."""
+    fields = [Post._meta.get_field('pub_date'), Post._meta.get_field('modified'), Comment._meta.get_field('created')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково загружает пользователей, группы, посты, комментарии и подписки из JSONL или CSV. '
+        'Каждая запись содержит поле type; посты сохраняют id из файла, если он указан и свободен'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .jsonl или .csv, можно сжатый .gz; - для стандартного ввода')
+        parser.add_argument('--format', choices=('jsonl', 'csv'), help='По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--source',
+            help='Имя источника, под которым в базе хранится, сколько его записей загружено; '
+                 'по умолчанию полный путь к файлу. Повторный запуск продолжает с первой незагруженной записи'
+        )
+        parser.add_argument(
+            '--skip-repair', action='store_true',
+            help='Не пересчитывать счётчики и ленты после загрузки'
+        )
+
+    def handle(self, *args, path, format, batch_size, source, skip_repair, **options):
+        data_format = format or ('csv' if re.sub(r'\.gz$', '', path).endswith('.csv') else 'jsonl')
+        if source is None:
+            # У стандартного ввода нет имени: каждый запуск — новый источник.
+            source = f'-:{time.time_ns()}' if path == '-' else os.path.abspath(path)
+        self.source, _ = ImportSource.objects.get_or_create(name=source)
+        done = self.source.records
+        if done:
+            self.stdout.write(f'Продолжаем после записи {done}')
+
+        self.next_post_id = (Post.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        self.buffers = {kind: [] for kind in KINDS}
+        self.created = dict.fromkeys(KINDS, 0)
+        self.skipped = 0
+        self.remapped = 0
+
+        started = time.monotonic()
+        number = done
+        with preserve_timestamps():
+            for number, record in enumerate(read_records(path, data_format), 1):
+                if number <= done:
+                    continue
+                self.buffers[self.validate(number, record)].append(record)
+                if (number - done) % batch_size == 0:
+                    self.flush(number)
+                    self.progress(number - done, started)
+            self.flush(number)
+
+        if not skip_repair and number > done:
+            self.repair()
+
+        self.progress(number - done, started)
+        if self.remapped:
+            self.stdout.write(self.style.WARNING(f'Постов с занятым id, загруженных под новым id: {self.remapped}'))
+        summary = ', '.join(f'{kind}: {count}' for kind, count in self.created.items())
+        self.stdout.write(self.style.SUCCESS(f'Загружено {summary}; пропущено {self.skipped}'))
+
+    def validate(self, number, record):
+        kind = record.get('type')
+        if kind not in KINDS:
+            raise CommandError(f'Запись {number}: неизвестный тип {kind!r}')
+        missing = [field for field in REQUIRED[kind] if not record.get(field)]
+        if missing:
+            raise CommandError(f'Запись {number}: нет полей {", ".join(missing)}')
+        return kind
+
+    def progress(self, count, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(f'Обработано записей: {count} ({count / elapsed:.0f} в секунду)')
+
+    def flush(self, number):
+        # Данные пачки и число загруженных записей фиксируются вместе.
+        with transaction.atomic():
+            self.flush_users()
+            self.flush_groups()
+            self.flush_posts()
+            self.flush_comments()
+            self.flush_follows()
+            ImportSource.objects.filter(pk=self.source.pk).update(records=number)
+        self.buffers = {kind: [] for kind in KINDS}
+
+    def flush_users(self):
+        # Справочники держатся только для текущей пачки, чтобы память не росла с базой.
+        details = {record['username']: record for record in self.buffers['user']}
+        wanted = set(details)
+        wanted.update(record['author'] for record in self.buffers['post'] + self.buffers['comment'])
+        for record in self.buffers['follow']:
+            wanted.update((record['user'], record['author']))
+        self.users = {}
+        for chunk in chunks(wanted, LOOKUP_CHUNK):
+            self.users.update(User.objects.filter(username__in=chunk).values_list('username', 'id'))
+        missing = sorted(username for username in wanted if username not in self.users)
+        if not missing:
+            return
+
+        User.objects.bulk_create([
+            User(
+                username=username,
+                first_name=details.get(username, {}).get('first_name', ''),
+                last_name=details.get(username, {}).get('last_name', ''),
+                email=details.get(username, {}).get('email', ''),
+                password=make_password(None),
+            )
+            for username in missing
+        ])
+        for chunk in chunks(missing, LOOKUP_CHUNK):
+            self.users.update(User.objects.filter(username__in=chunk).values_list('username', 'id'))
+        self.created['user'] += len(missing)
+
+    def flush_groups(self):
+        details = {record['slug']: record for record in self.buffers['group']}
+        wanted = set(details)
+        wanted.update(record['group'] for record in self.buffers['post'] if record.get('group'))
+        self.groups = {}
+        for chunk in chunks(wanted, LOOKUP_CHUNK):
+            self.groups.update(Group.objects.filter(slug__in=chunk).values_list('slug', 'id'))
+        missing = sorted(slug for slug in wanted if slug not in self.groups)
+        if not missing:
+            return
+
+        Group.objects.bulk_create([
+            Group(
+                slug=slug,
+                title=details.get(slug, {}).get('title', slug),
+                description=details.get(slug, {}).get('description', ''),
+            )
+            for slug in missing
+        ])
+        for chunk in chunks(missing, LOOKUP_CHUNK):
+            self.groups.update(Group.objects.filter(slug__in=chunk).values_list('slug', 'id'))
+        self.created['group'] += len(missing)
+
+    def flush_posts(self):
+        records = self.buffers['post']
+        wanted_ids = {int(record['id']) for record in records if record.get('id')}
+        taken = set()
+        for chunk in chunks(wanted_ids, LOOKUP_CHUNK):
+            taken.update(Post.objects.filter(pk__in=chunk).values_list('id', flat=True))
+
+        # Сначала id получают записи, чей id свободен, потом остальные:
+        # новый id не должен занять id, который ещё ждёт запись той же пачки.
+        posts, pending, remapped = [], [], []
+        for record in records:
+            file_id = int(record['id']) if record.get('id') else None
+            if file_id is not None and file_id not in taken:
+                taken.add(file_id)
+                posts.append(self.build_post(record, file_id))
+            else:
+                pending.append((record, file_id))
+        for record, file_id in pending:
+            while self.next_post_id in taken or self.next_post_id in wanted_ids:
+                self.next_post_id += 1
+            taken.add(self.next_post_id)
+            posts.append(self.build_post(record, self.next_post_id))
+            if file_id is not None:
+                remapped.append(ImportedPost(source=self.source, file_id=file_id, post_id=self.next_post_id))
+        for post in posts:
+            self.next_post_id = max(self.next_post_id, post.id + 1)
+
+        Post.objects.bulk_create(posts)
+        ImportedPost.objects.bulk_create(remapped)
+        search.index_posts([(post.id, post.text) for post in posts])
+        self.created['post'] += len(posts)
+        self.remapped += len(remapped)
+
+    def build_post(self, record, pk):
+        pub_date = parse_moment(record.get('pub_date'))
+        return Post(
+            id=pk,
+            text=record['text'],
+            pub_date=pub_date,
+            modified=pub_date,
+            author_id=self.users[record['author']],
+            group_id=self.groups[record['group']] if record.get('group') else None,
+            image=record.get('image', ''),
+        )
+
+    def flush_comments(self):
+        # Комментарий ссылается на пост из файла, а если его в файле не было —
+        # на пост, уже лежащий в базе под этим id. Посты файла, загруженные
+        # под новым id, находятся по ImportedPost.
+        wanted = {int(record['post']) for record in self.buffers['comment']}
+        post_ids = {}
+        for chunk in chunks(wanted, LOOKUP_CHUNK):
+            post_ids.update(ImportedPost.objects.filter(source=self.source, file_id__in=chunk).values_list(
+                'file_id', 'post_id'
+            ))
+        for chunk in chunks(wanted - set(post_ids), LOOKUP_CHUNK):
+            post_ids.update((pk, pk) for pk in Post.objects.filter(pk__in=chunk).values_list('id', flat=True))
+
+        comments = [
+            Comment(
+                post_id=post_ids[int(record['post'])],
+                author_id=self.users[record['author']],
+                text=record['text'],
+                created=parse_moment(record.get('created')),
+            )
+            for record in self.buffers['comment']
+            if int(record['post']) in post_ids
+        ]
+        Comment.objects.bulk_create(comments)
+        self.created['comment'] += len(comments)
+        self.skipped += len(self.buffers['comment']) - len(comments)
+
+    def flush_follows(self):
+        follows = [
+            Follow(user_id=self.users[record['user']], author_id=self.users[record['author']])
+            for record in self.buffers['follow']
+            if record['user'] != record['author']
+        ]
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        self.created['follow'] += len(follows)
+        self.skipped += len(self.buffers['follow']) - len(follows)
+
+    def repair(self):
+        # bulk_create не посылает сигналов: счётчики, ленты и кэш приводим в порядок отдельно.
+        self.stdout.write('Пересчёт счётчиков и лент')
+        call_command('recount_comments', stdout=self.stdout)
+        call_command('reconcile_stats', stdout=self.stdout)
+        call_command('rebuild_timelines', refresh_pulled=True, stdout=self.stdout)
+        bump('feed')
+        bump('page')
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import profiler
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выдаёт токен для заголовка X-Yatube-Profile, по которому профилируется запрос'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Сотрудник, от имени которого снимаются профили')
+
+    def handle(self, *args, username, **options):
+        user = User.objects.filter(username=username, is_staff=True, is_active=True).first()
+        if user is None:
+            raise CommandError(f'Нет действующего сотрудника {username}')
+        self.stdout.write(f'X-Yatube-Profile: {profiler.make_token(user)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Токен действует {settings.PROFILER_TOKEN_MAX_AGE // 60} мин.; '
+            f'вид профиля задаётся ?{profiler.PARAM}=cprofile или ?{profiler.PARAM}=sample'
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+from posts.models import Follow, User
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Пользователи; по умолчанию все, у кого есть подписки')
+        parser.add_argument(
+            '--refresh-pulled', action='store_true',
+            help='Заново определить авторов, чьи посты подмешиваются при чтении'
+        )
+
+    def handle(self, *args, usernames, refresh_pulled, **options):
+        if refresh_pulled:
+            timeline.refresh_pulled_authors()
+
+        if usernames:
+            user_ids = User.objects.filter(username__in=usernames).values_list('id', flat=True)
+        else:
+            user_ids = Follow.objects.order_by().values_list('user_id', flat=True).distinct()
+
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            with transaction.atomic():
+                timeline.rebuild(user_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Пересобрано лент: {rebuilt}'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import stats
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики подписчиков, подписок и записей с таблицами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        fixed = 0
+        last_pk = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not user_ids:
+                break
+            last_pk = user_ids[-1]
+            with transaction.atomic():
+                fixed += stats.reconcile(user_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Исправлено записей: {fixed}'))
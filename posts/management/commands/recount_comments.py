@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает Post.comment_count по таблице комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько счётчиков разошлось')
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(total=Count('pk'))
+        actual = Coalesce(Subquery(comments.values('total'), output_field=IntegerField()), 0)
+
+        fixed = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+
+            drifted = Post.objects.filter(pk__in=pks).annotate(actual=actual).filter(~Q(comment_count=F('actual')))
+            if dry_run:
+                fixed += drifted.count()
+                continue
+            with transaction.atomic():
+                fixed += Post.objects.filter(pk__in=drifted.values('pk')).update(comment_count=actual)
+
+        verb = 'Разошлось' if dry_run else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(f'{verb} счётчиков: {fixed}'))
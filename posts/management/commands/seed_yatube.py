@@ -0,0 +1,111 @@
+import json
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from posts.models import ImportSource, Post
+
+
+WORDS = (
+    'котики собаки погода город река лес море книга фильм музыка поезд самолёт кофе чай утро вечер '
+    'работа отпуск дорога горы друзья семья праздник снег дождь солнце весна осень лето зима'
+).split()
+# Начало отсчёта дат фиксировано, чтобы одинаковый --seed давал одинаковые данные.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize()
+
+
+class Command(BaseCommand):
+    help = 'Наполняет базу воспроизводимыми тестовыми данными для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=2000)
+        parser.add_argument('--images', type=int, default=20, help='Сколько постов получат картинки')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='bench', help='Префикс имён пользователей и групп')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, users, groups, posts, comments, follows, images, seed, prefix, batch_size, **options):
+        rng = random.Random(seed)
+        first_post = (Post.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        image_names = self.images(rng, prefix, min(images, posts))
+
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as stream:
+                for record in self.records(rng, prefix, users, groups, posts, comments, follows, first_post, image_names):
+                    stream.write(json.dumps(record, ensure_ascii=False))
+                    stream.write('\n')
+            call_command('import_yatube', path, batch_size=batch_size, stdout=self.stdout)
+        finally:
+            os.remove(path)
+            # Временный файл удалён, его прогресс загрузки больше не нужен.
+            ImportSource.objects.filter(name=os.path.abspath(path)).delete()
+
+        if image_names:
+            call_command('generate_thumbnails', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {users}, групп: {groups}, постов: {posts}, комментариев: {comments}'
+        ))
+
+    def images(self, rng, prefix, count):
+        names = []
+        for i in range(count):
+            color = tuple(rng.randrange(256) for _ in range(3))
+            buffer = BytesIO()
+            Image.new('RGB', (1200, 800), color).save(buffer, 'JPEG')
+            names.append(default_storage.save(f'posts/{prefix}_{i}.jpg', ContentFile(buffer.getvalue())))
+        return names
+
+    def records(self, rng, prefix, users, groups, posts, comments, follows, first_post, image_names):
+        usernames = [f'{prefix}_user_{i}' for i in range(users)]
+        slugs = [f'{prefix}_group_{i}' for i in range(groups)]
+
+        for username in usernames:
+            yield {'type': 'user', 'username': username, 'first_name': sentence(rng, 1, 1)}
+        for slug in slugs:
+            yield {'type': 'group', 'slug': slug, 'title': sentence(rng, 1, 3), 'description': sentence(rng, 5, 15)}
+
+        # Авторы распределены неравномерно: у немногих популярных большинство постов и подписчиков.
+        weights = [1 / (rank + 1) for rank in range(users)]
+        authors = rng.choices(usernames, weights, k=posts)
+        for i, author in enumerate(authors):
+            yield {
+                'type': 'post',
+                'id': first_post + i,
+                'author': author,
+                'group': rng.choice(slugs) if slugs and rng.random() < 0.5 else None,
+                'text': sentence(rng, 5, 60),
+                'pub_date': (EPOCH + timedelta(minutes=i * 10 + rng.randrange(10))).isoformat(),
+                'image': image_names[i] if i < len(image_names) else '',
+            }
+
+        for _ in range(comments if posts else 0):
+            # Комментарии тоже неравномерны: у первых постов их тысячи, у большинства единицы.
+            index = min(int(rng.expovariate(5 / posts)), posts - 1)
+            yield {
+                'type': 'comment',
+                'post': first_post + index,
+                'author': rng.choice(usernames),
+                'text': sentence(rng, 2, 20),
+                'created': (EPOCH + timedelta(minutes=index * 10 + rng.randrange(60 * 24 * 30))).isoformat(),
+            }
+
+        for _ in range(follows):
+            user, author = rng.choice(usernames), rng.choices(usernames, weights)[0]
+            yield {'type': 'follow', 'user': user, 'author': author}
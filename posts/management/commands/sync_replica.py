@@ -0,0 +1,59 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from yatube import replicas
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файлы реплик через backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Реплики из DATABASES; по умолчанию все')
+        parser.add_argument('--to', dest='target', help='Скопировать в этот файл вместо реплик')
+        parser.add_argument('--interval', type=float, help='Повторять раз в столько секунд, пока не прервут')
+
+    def handle(self, *args, aliases, target, interval, **options):
+        source = connections[DEFAULT_DB_ALIAS]
+        if source.vendor != 'sqlite':
+            raise CommandError('Копирование поддерживается только для SQLite')
+        if target:
+            targets = {None: target}
+        else:
+            unknown = set(aliases) - set(settings.DATABASE_REPLICAS)
+            if unknown:
+                raise CommandError(f'Неизвестные реплики: {", ".join(sorted(unknown))}')
+            targets = {
+                alias: connections[alias].settings_dict['NAME'] for alias in aliases or settings.DATABASE_REPLICAS
+            }
+        if not targets:
+            raise CommandError('Реплики не настроены: задайте YATUBE_DB_REPLICAS или --to')
+
+        while True:
+            started = time.perf_counter()
+            self.sync(source, targets)
+            self.stdout.write(self.style.SUCCESS(
+                f'Скопировано в {", ".join(targets.values())} за {time.perf_counter() - started:.2f} с'
+            ))
+            if interval is None:
+                break
+            time.sleep(interval)
+
+    def sync(self, source, targets):
+        source.ensure_connection()
+        for alias, name in targets.items():
+            # Копия содержит всё, что записано до начала копирования: это время
+            # и сравнивает ReplicaMiddleware с временем последней записи.
+            moment = time.time()
+            # backup пишет страницы поверх файла под его же блокировкой, так что
+            # читатели реплики видят либо старую копию, либо новую целиком.
+            replica = sqlite3.connect(name)
+            try:
+                source.connection.backup(replica)
+            finally:
+                replica.close()
+            if alias is not None:
+                replicas.mark_synced(alias, moment)
@@ -0,0 +1,76 @@
+import hashlib
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from .cache import fetch, generation
+
+
+CACHED_VIEWS = {
+    'index', 'group', 'profile', 'post',
+    'api_index', 'api_group', 'api_profile', 'api_post', 'api_comments',
+}
+
+
+def page_digest(request):
+    query = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    raw = f'{request.path}?{query}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def page_key(request):
+    return f'posts:page:{generation("page")}:{page_digest(request)}'
+
+
+def latest_key(request):
+    """Последняя сохранённая версия страницы любого поколения: её отдают, пока новая считается."""
+    return f'posts:page:latest:{page_digest(request)}'
+
+
+class AnonymousPageCacheMiddleware:
+    """Кэширует страницы лент и постов целиком для анонимных читателей.
+
+    Ключ строится из пути, отсортированной строки запроса и поколения
+    'page', которое сбрасывают сигналы Post, Comment, Follow и Group.
+    Ответы, выставляющие cookie (в том числе CSRF), не кэшируются. После
+    сброса поколения страницу пересчитывает один запрос, остальные
+    получают прежнюю версию с X-Page-Cache: STALE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.eligible(request):
+            return self.get_response(request)
+        if request.user.is_authenticated:
+            response = self.get_response(request)
+            response['X-Page-Cache'] = 'BYPASS'
+            return response
+
+        response, state = fetch(
+            page_key(request),
+            lambda: self.get_response(request),
+            settings.PAGE_CACHE_TIMEOUT,
+            stale_key=latest_key(request),
+            store=lambda response: self.cacheable(request, response),
+        )
+        response['X-Page-Cache'] = state.upper()
+        return response
+
+    def eligible(self, request):
+        if request.method not in ('GET', 'HEAD') or getattr(request, 'profiled', False):
+            return False
+        try:
+            return resolve(request.path_info).url_name in CACHED_VIEWS
+        except Resolver404:
+            return False
+
+    def cacheable(self, request, response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get('CSRF_COOKIE_USED')
+            and not response.has_header('Cache-Control')
+        )
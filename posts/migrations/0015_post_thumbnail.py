@@ -0,0 +1,27 @@
+# Generated by Django 2.2.6 on 2026-10-18 06:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_author_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostThumbnail',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='thumbnail', serialize=False, to='posts.Post')),
+                ('source', models.CharField(max_length=255)),
+                ('url', models.CharField(max_length=255)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('srcset', models.TextField()),
+                ('placeholder', models.TextField()),
+                ('created', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
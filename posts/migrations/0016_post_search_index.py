@@ -0,0 +1,88 @@
+# Generated by Django 2.2.6 on 2026-10-18 07:02
+
+import re
+
+from django.db import migrations
+
+
+# Стеммер и схема индекса скопированы из posts.search на момент миграции:
+# последующие правки модуля не должны менять то, что делает миграция.
+TABLE = 'posts_post_fts'
+WORD = re.compile(r'\w+')
+
+# Стеммер Портера для русского языка (snowball, упрощённый вариант).
+VOWELS = 'аеиоуыэюя'
+PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    start = next((i + 1 for i, char in enumerate(word) if char in VOWELS), None)
+    if start is None:
+        return word
+    head, rv = word[:start], word[start:]
+
+    rv, found = PERFECTIVE_GERUND.subn('', rv)
+    if not found:
+        rv = REFLEXIVE.sub('', rv)
+        rv, found = ADJECTIVE.subn('', rv)
+        if found:
+            rv = PARTICIPLE.sub('', rv)
+        else:
+            rv, found = VERB.subn('', rv)
+            if not found:
+                rv = NOUN.sub('', rv)
+
+    rv = re.sub('и$', '', rv)
+    if DERIVATIONAL.match(rv):
+        rv = re.sub('ость?$', '', rv)
+    rv, found = re.subn('ь$', '', rv)
+    if not found:
+        rv = SUPERLATIVE.sub('', rv)
+        rv = re.sub('нн$', 'н', rv)
+
+    return head + rv
+
+
+def terms(text):
+    return [stem(word) for word in WORD.findall(text)]
+
+
+def build_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(body, tokenize = 'unicode61')")
+        for pk, text in Post.objects.values_list('pk', 'text').iterator():
+            cursor.execute(f'INSERT INTO {TABLE} (rowid, body) VALUES (%s, %s)', [pk, ' '.join(terms(text))])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.6 on 2026-10-18 07:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_profilerecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportSource',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500, unique=True)),
+                ('records', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportedPost',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_id', models.BigIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Post')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='remapped_posts', to='posts.ImportSource')),
+            ],
+            options={
+                'unique_together': {('source', 'file_id')},
+            },
+        ),
+    ]
@@ -19,9 +19,16 @@ class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     group = models.ForeignKey(Group, on_delete=models.SET_NULL, blank=True, null=True, related_name='posts')
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    modified = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'], name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'], name='post_group_pub_date_idx'),
+            models.Index(fields=['-pub_date', '-id'], name='post_pub_date_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -30,6 +37,11 @@ class Comment(models.Model):
     text = models.TextField(max_length=200)
     created = models.DateTimeField("date published", auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'], name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follower')
@@ -37,3 +49,96 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('user', 'author')
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_author_user_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+
+class PulledAuthor(models.Model):
+    author = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='pulled')
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    followers = models.PositiveIntegerField(default=0)
+    following = models.PositiveIntegerField(default=0)
+    posts = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+
+class PostThumbnail(models.Model):
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='thumbnail')
+    source = models.CharField(max_length=255)
+    url = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    srcset = models.TextField()
+    placeholder = models.TextField()
+    created = models.DateTimeField(auto_now=True)
+
+
+class ProfileRecord(models.Model):
+    CPROFILE = 'cprofile'
+    SAMPLE = 'sample'
+    KINDS = ((CPROFILE, 'cProfile (pstats)'), (SAMPLE, 'Сэмплы стеков (flamegraph)'))
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='profiles')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view = models.CharField(max_length=100, blank=True)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    status = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    queries = models.PositiveIntegerField(default=0)
+    # Верх отчёта для просмотра в админке; целиком профиль лежит в data.
+    summary = models.TextField()
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.get_kind_display()})'
+
+    @property
+    def filename(self):
+        extension = 'prof' if self.kind == self.CPROFILE else 'folded'
+        return f'profile-{self.pk}.{extension}'
+
+
+class ImportSource(models.Model):
+    """Файл, загруженный import_yatube, и сколько его записей уже в базе.
+
+    Число записей меняется в той же транзакции, что и сами данные, поэтому
+    после сбоя загрузка продолжается ровно с первой незафиксированной записи.
+    """
+    name = models.CharField(max_length=500, unique=True)
+    records = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class ImportedPost(models.Model):
+    """Пост из файла, чей id был занят: комментарии из файла идут по этой записи."""
+    source = models.ForeignKey(ImportSource, on_delete=models.CASCADE, related_name='remapped_posts')
+    file_id = models.BigIntegerField()
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('source', 'file_id')
@@ -0,0 +1,138 @@
+import base64
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+FEED_ORDERING = ('-pub_date', '-id')
+
+Source = namedtuple('Source', ('queryset', 'ordering', 'transform'), defaults=(FEED_ORDERING, None))
+
+
+def encode_cursor(values):
+    raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, model, ordering):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            return None
+        if model is None:
+            return values
+        return [
+            model._meta.get_field(name.lstrip('-')).to_python(value)
+            for name, value in zip(ordering, values)
+        ]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def cursor_values(row, ordering):
+    names = [name.lstrip('-') for name in ordering]
+    if isinstance(row, dict):
+        return [row[name] for name in names]
+    return [getattr(row, name) for name in names]
+
+
+def reverse_ordering(ordering):
+    return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+
+def seek(ordering, values):
+    """Условие «строго после values» для сортировки ordering.
+
+    Первая колонка дополнительно ограничена нестрогим неравенством,
+    чтобы СУБД могла начать просмотр индекса с нужного места.
+    """
+    condition = Q()
+    for i, name in enumerate(ordering):
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        step = Q(**{f'{name.lstrip("-")}__{lookup}': values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+
+    first = ordering[0]
+    bound = 'lte' if first.startswith('-') else 'gte'
+    return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
+
+
+def page_number(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def window(source, values, backwards, offset, limit):
+    ordering = reverse_ordering(source.ordering) if backwards else source.ordering
+    queryset = source.queryset.order_by(*ordering)
+    if values is not None:
+        queryset = queryset.filter(seek(ordering, values))
+    transform = source.transform or (lambda row: row)
+    return [(cursor_values(row, source.ordering), transform(row)) for row in queryset[offset:offset + limit]]
+
+
+def fetch(sources, values, backwards, offset, limit):
+    if len(sources) == 1:
+        return window(sources[0], values, backwards, offset, limit)
+
+    rows, seen = [], set()
+    for source in sources:
+        for key, row in window(source, values, backwards, 0, offset + limit):
+            if tuple(key) not in seen:
+                seen.add(tuple(key))
+                rows.append((key, row))
+    descending = sources[0].ordering[0].startswith('-') != backwards
+    rows.sort(key=lambda item: item[0], reverse=descending)
+    return rows[offset:offset + limit]
+
+
+def paginate_sources(request, sources, per_page):
+    """Постраничный вывод по ключу (курсору) вместо COUNT(*) и OFFSET.
+
+    Возвращает пару (paginator, page), где page — обычный Page,
+    дополненный атрибутами next_cursor и previous_cursor. Старые ссылки
+    вида ?page=N продолжают работать через OFFSET. Если источников
+    несколько, их окна сливаются по общему ключу сортировки.
+    """
+    first = sources[0]
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    after_values = decode_cursor(after, first.queryset.model, first.ordering) if after else None
+    before_values = decode_cursor(before, first.queryset.model, first.ordering) if before else None
+
+    if after_values is not None:
+        rows = fetch(sources, after_values, False, 0, per_page + 1)
+        has_next, has_previous = len(rows) > per_page, True
+        rows = rows[:per_page]
+    elif before_values is not None:
+        rows = fetch(sources, before_values, True, 0, per_page + 1)
+        has_next, has_previous = True, len(rows) > per_page
+        rows = rows[:per_page][::-1]
+    else:
+        number = page_number(request.GET.get('page'))
+        rows = fetch(sources, None, False, (number - 1) * per_page, per_page + 1)
+        has_next, has_previous = len(rows) > per_page, number > 1
+        rows = rows[:per_page]
+
+    if not rows and (has_previous or has_next):
+        rows = fetch(sources, None, False, 0, per_page + 1)
+        has_next, has_previous = len(rows) > per_page, False
+        rows = rows[:per_page]
+
+    paginator = Paginator([row for _, row in rows], per_page)
+    page = paginator.page(1)
+    page.next_cursor = encode_cursor(rows[-1][0]) if has_next else None
+    page.previous_cursor = encode_cursor(rows[0][0]) if has_previous else None
+
+    return paginator, page
+
+
+def paginate(request, queryset, per_page, ordering=FEED_ORDERING):
+    return paginate_sources(request, [Source(queryset, ordering)], per_page)
@@ -0,0 +1,172 @@
+"""Профиль одного запроса по требованию сотрудника.
+
+Профиль снимается, если сотрудник (is_staff) добавил к адресу
+?_profile=cprofile или ?_profile=sample, либо запрос пришёл с заголовком
+X-Yatube-Profile, где лежит подписанный токен из команды profile_token;
+по токену можно профилировать запрос из любой сессии, в том числе
+тестовой учётной записи, и из curl. Результат сохраняется в
+ProfileRecord и виден в админке. Профилей на сайт не больше одного за
+PROFILER_RATE_LIMIT секунд, остальные запросы обрабатываются как обычно.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from yatube import instrumentation
+from .models import ProfileRecord, User
+
+
+PARAM = '_profile'
+HEADER = 'HTTP_X_YATUBE_PROFILE'
+SALT = 'posts.profiler'
+RATE_KEY = 'posts:profiler:slot'
+
+
+def make_token(user):
+    return signing.dumps({'user': user.pk}, salt=SALT)
+
+
+def token_user(token):
+    try:
+        data = signing.loads(token, salt=SALT, max_age=settings.PROFILER_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=data.get('user'), is_staff=True, is_active=True).first()
+
+
+def requested(request):
+    """Пара (вид профиля, сотрудник), если запрос нужно профилировать, иначе None."""
+    token = request.META.get(HEADER)
+    kind = request.GET.get(PARAM)
+    if token is None and kind is None:
+        return None
+    kind = kind or ProfileRecord.CPROFILE
+    if kind not in dict(ProfileRecord.KINDS):
+        return None
+    user = token_user(token) if token else request.user
+    if user is None or not user.is_staff:
+        return None
+    return kind, user
+
+
+class CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+
+    def result(self):
+        """Пара (верх отчёта, файл pstats)."""
+        stats = pstats.Stats(self.profile, stream=io.StringIO())
+        stats.sort_stats('cumulative').print_stats(settings.PROFILER_REPORT_LINES)
+        # Тот же формат, что у pstats.Stats.dump_stats: файл открывается snakeviz и pstats.
+        return stats.stream.getvalue(), marshal.dumps(stats.stats)
+
+
+def frame_label(frame):
+    return f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_name}'
+
+
+class StackSampler(threading.Thread):
+    """Раз в PROFILER_SAMPLE_INTERVAL секунд записывает стек потока запроса.
+
+    Стеки копятся в свёрнутом виде (collapsed stacks), который понимают
+    flamegraph.pl и speedscope.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.target = threading.get_ident()
+        self.interval = settings.PROFILER_SAMPLE_INTERVAL
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def __enter__(self):
+        self.start()
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def result(self):
+        total = sum(self.stacks.values())
+        own = Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(';', 1)[-1]] += count
+        lines = [f'Сэмплов: {total}, интервал {self.interval * 1000:g} мс', '']
+        for name, count in own.most_common(settings.PROFILER_REPORT_LINES):
+            lines.append(f'{count:>6}  {count / total:6.1%}  {name}')
+        folded = ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+        return '\n'.join(lines), folded.encode()
+
+
+PROFILERS = {ProfileRecord.CPROFILE: CProfiler, ProfileRecord.SAMPLE: StackSampler}
+
+
+class ProfilerMiddleware:
+    """Снимает профиль запроса, если его попросил сотрудник.
+
+    Стоит после AuthenticationMiddleware и до кэша страниц, который
+    профилируемые запросы пропускает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        wanted = requested(request)
+        if wanted is None:
+            return self.get_response(request)
+        if not cache.add(RATE_KEY, True, settings.PROFILER_RATE_LIMIT):
+            response = self.get_response(request)
+            response['X-Profile'] = 'rate-limited'
+            return response
+
+        kind, user = wanted
+        request.profiled = True
+        metrics = instrumentation.current.get()
+        queries = metrics.queries if metrics is not None else 0
+        profiler = PROFILERS[kind]()
+        started = time.perf_counter()
+        with profiler:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        summary, data = profiler.result()
+        record = ProfileRecord.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            view=instrumentation.view_name(request) or '',
+            kind=kind,
+            status=response.status_code,
+            duration_ms=round(duration * 1000, 2),
+            queries=metrics.queries - queries if metrics is not None else 0,
+            summary=summary,
+            data=data,
+        )
+        response['X-Profile'] = str(record.pk)
+        return response
@@ -0,0 +1,155 @@
+import re
+
+from django.core.paginator import Paginator
+from django.db import connection
+
+from . import paginator
+from .models import Post
+
+
+TABLE = 'posts_post_fts'
+WORD = re.compile(r'\w+')
+
+# Стеммер Портера для русского языка (snowball, упрощённый вариант).
+VOWELS = 'аеиоуыэюя'
+PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    start = next((i + 1 for i, char in enumerate(word) if char in VOWELS), None)
+    if start is None:
+        return word
+    head, rv = word[:start], word[start:]
+
+    rv, found = PERFECTIVE_GERUND.subn('', rv)
+    if not found:
+        rv = REFLEXIVE.sub('', rv)
+        rv, found = ADJECTIVE.subn('', rv)
+        if found:
+            rv = PARTICIPLE.sub('', rv)
+        else:
+            rv, found = VERB.subn('', rv)
+            if not found:
+                rv = NOUN.sub('', rv)
+
+    rv = re.sub('и$', '', rv)
+    if DERIVATIONAL.match(rv):
+        rv = re.sub('ость?$', '', rv)
+    rv, found = re.subn('ь$', '', rv)
+    if not found:
+        rv = SUPERLATIVE.sub('', rv)
+        rv = re.sub('нн$', 'н', rv)
+
+    return head + rv
+
+
+def terms(text):
+    return [stem(word) for word in WORD.findall(text)]
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def index_post(post):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(f'INSERT INTO {TABLE} (rowid, body) VALUES (%s, %s)', [post.pk, ' '.join(terms(post.text))])
+
+
+def index_posts(rows):
+    """Индексирует пачку пар (id, текст) поста двумя executemany."""
+    if not available() or not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [[pk] for pk, _ in rows])
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, body) VALUES (%s, %s)', [[pk, ' '.join(terms(text))] for pk, text in rows]
+        )
+
+
+def remove_post(post_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def match_expression(query):
+    # Каждая основа берётся в кавычки, чтобы пользовательский ввод
+    # не разбирался как синтаксис FTS5, и ищется как префикс.
+    return ' '.join(f'"{term}"*' for term in terms(query))
+
+
+def filter_matching(queryset, query):
+    """Оставляет в queryset постов только подходящие под query.
+
+    Запрос без слов (например, из одних знаков препинания) не находит ничего.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    column = f'"{queryset.model._meta.db_table}"."{queryset.model._meta.pk.column}"'
+    return queryset.extra(
+        where=[f'{column} IN (SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)'],
+        params=[expression],
+    )
+
+
+def search(query, cursor=None, limit=20):
+    """Ищет посты по query, лучшие совпадения первыми.
+
+    Возвращает пару (список (id, rank), курсор следующей страницы или None).
+    """
+    expression = match_expression(query)
+    if not expression:
+        return [], None
+
+    sql = f'SELECT rowid, rank FROM {TABLE} WHERE {TABLE} MATCH %s'
+    params = [expression]
+    position = paginator.decode_cursor(cursor, None, ('rank', 'id')) if cursor else None
+    try:
+        position = position and (float(position[0]), int(position[1]))
+    except (TypeError, ValueError):
+        position = None
+    if position:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [position[0], position[0], position[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(limit + 1)
+
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        rows = db.fetchall()
+
+    next_cursor = paginator.encode_cursor([rows[limit - 1][1], rows[limit - 1][0]]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def paginate(request, query, per_page):
+    """Страница результатов поиска в том же виде, что и у лент."""
+    posts = Post.objects.select_related('author', 'group')
+    if not available():
+        return paginator.paginate(request, posts.filter(text__icontains=query), per_page)
+
+    rows, next_cursor = search(query, request.GET.get('after'), per_page)
+    found = posts.in_bulk([pk for pk, _ in rows])
+    results = Paginator([found[pk] for pk, _ in rows if pk in found], per_page)
+    page = results.page(1)
+    page.next_cursor, page.previous_cursor = next_cursor, None
+    return results, page
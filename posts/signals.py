@@ -0,0 +1,140 @@
+from contextvars import ContextVar
+
+from django.core.signals import request_finished
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache, search, stats, timeline
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+# id постов, которые сейчас удаляются: их комментарии уходят каскадом, и
+# пересчитывать счётчик и сбрасывать кэши для каждого из них незачем. Если
+# удаление упало между pre_delete и post_delete, отметка сбрасывается в
+# конце запроса, иначе следующие удаления комментариев того же поста в этом
+# потоке не уменьшали бы счётчик.
+deleting_posts = ContextVar('deleting_posts', default=frozenset())
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_posts.set(deleting_posts.get() | {instance.pk})
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_posts.set(deleting_posts.get() - {instance.pk})
+
+
+@receiver(request_finished)
+def request_done(sender, **kwargs):
+    deleting_posts.set(frozenset())
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Post.objects.filter(pk=instance.post_id).update(comment_count=F('comment_count') + 1, modified=timezone.now())
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts.get():
+        return
+    Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1, modified=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+def invalidate_feeds(sender, instance, **kwargs):
+    if sender is Comment and instance.post_id in deleting_posts.get():
+        # Кэши сбросит удаление самого поста.
+        return
+    cache.bump('feed')
+    cache.bump('page')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=User)
+def invalidate_cards(sender, created=False, update_fields=None, **kwargs):
+    # Карточки показывают название группы и имя автора. У новых групп и
+    # пользователей карточек ещё нет, а вход сохраняет только last_login.
+    if created or set(update_fields or ()) == {'last_login'}:
+        return
+    cache.bump('card')
+    if sender is User:
+        # Имя автора есть и в собранных лентах, и в кэше страниц профиля;
+        # для групп их сбрасывает invalidate_feeds.
+        cache.bump('feed')
+        cache.bump('page')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_pages(sender, **kwargs):
+    cache.bump('page')
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.adjust(instance.author_id, 'posts', 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_uncounted(sender, instance, **kwargs):
+    stats.adjust(instance.author_id, 'posts', -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.adjust(instance.author_id, 'followers', 1)
+        stats.adjust(instance.user_id, 'following', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_uncounted(sender, instance, **kwargs):
+    stats.adjust(instance.author_id, 'followers', -1)
+    stats.adjust(instance.user_id, 'following', -1)
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
@@ -0,0 +1,73 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import AuthorStats, Follow, Post, User
+
+
+FIELDS = ('followers', 'following', 'posts')
+
+
+def counted(user_id):
+    return AuthorStats(
+        user_id=user_id,
+        followers=Follow.objects.filter(author_id=user_id).count(),
+        following=Follow.objects.filter(user_id=user_id).count(),
+        posts=Post.objects.filter(author_id=user_id).count(),
+    )
+
+
+def for_user(user):
+    """Счётчики пользователя; недостающая запись создаётся пересчётом."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        stats = counted(user.pk)
+        try:
+            with transaction.atomic():
+                stats.save(force_insert=True)
+        except IntegrityError:
+            stats = AuthorStats.objects.get(pk=user.pk)
+        user.stats = stats
+        return stats
+
+
+def adjust(user_id, field, delta):
+    # Отсутствующую запись не создаём: её соберёт for_user, а адресат
+    # может как раз удаляться каскадом вместе с пользователем.
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats = stats.filter(**{f'{field}__gte': -delta})
+    stats.update(**{field: F(field) + delta, 'updated': timezone.now()})
+
+
+def counter(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('pk'))
+    return Coalesce(Subquery(counts.values('total'), output_field=IntegerField()), 0)
+
+
+def reconcile(user_ids):
+    """Сверяет счётчики пользователей user_ids с таблицами и чинит расхождения.
+
+    Возвращает число исправленных записей.
+    """
+    actual = User.objects.filter(pk__in=user_ids).annotate(
+        followers_total=counter(Follow.objects, 'author'),
+        following_total=counter(Follow.objects, 'user'),
+        posts_total=counter(Post.objects, 'author'),
+    ).values_list('pk', 'followers_total', 'following_total', 'posts_total')
+    stored = AuthorStats.objects.in_bulk(user_ids)
+
+    fixed = 0
+    for pk, *counts in actual:
+        expected = dict(zip(FIELDS, counts))
+        current = stored.get(pk)
+        if current is None:
+            AuthorStats.objects.get_or_create(user_id=pk, defaults=expected)
+        elif any(getattr(current, field) != value for field, value in expected.items()):
+            AuthorStats.objects.filter(pk=pk).update(updated=timezone.now(), **expected)
+        else:
+            continue
+        fixed += 1
+    return fixed
@@ -0,0 +1,65 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from ..cache import fetch
+
+
+register = template.Library()
+
+OPTIONS = ('generation', 'stale')
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time, fragment_name, vary_on, generation, stale):
+        self.nodelist = nodelist
+        self.expire_time = expire_time
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.generation = generation
+        self.stale = stale
+
+    def render(self, context):
+        try:
+            expire_time = int(self.expire_time.resolve(context))
+        except (ValueError, TypeError):
+            raise template.TemplateSyntaxError(f'"feedcache" tag got a non-integer timeout: {self.expire_time.var!r}')
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        # Ключ тот же, что у {% cache %} с поколением первым в списке.
+        key = make_template_fragment_key(self.fragment_name, [self.generation.resolve(context), *vary_on])
+        value, _ = fetch(
+            key,
+            lambda: self.nodelist.render(context),
+            expire_time,
+            stale_key=make_template_fragment_key(f'{self.fragment_name}.latest', vary_on),
+            allow_stale=self.stale is None or bool(self.stale.resolve(context)),
+        )
+        return value
+
+
+@register.tag('feedcache')
+def do_feedcache(parser, token):
+    """Как {% cache %}, но с защитой от лавины пересчётов (posts.cache.fetch).
+
+    {% feedcache timeout name var1 var2 generation=cache_generation stale=user.is_anonymous %}
+
+    Пока новое поколение фрагмента считает один запрос, остальные
+    получают версию прежнего поколения; stale=False это запрещает, например
+    для автора, который должен сразу увидеть свой пост.
+    """
+    nodelist = parser.parse(('endfeedcache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    options = {}
+    while len(bits) > 3 and bits[-1].split('=', 1)[0] in OPTIONS:
+        name, value = bits.pop().split('=', 1)
+        options[name] = parser.compile_filter(value)
+    if len(bits) < 3 or 'generation' not in options:
+        raise template.TemplateSyntaxError(f'{bits[0]!r} tag requires a timeout, a name and generation=')
+    return FeedCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+        options['generation'],
+        options.get('stale'),
+    )
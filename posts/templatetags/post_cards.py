@@ -0,0 +1,56 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from ..cache import card_key, generation
+
+
+register = template.Library()
+
+# Место ссылки «Редактировать» в отрисованной карточке: по нему карточка
+# делится на общую для всех читателей голову и хвост.
+EDIT_LINK = mark_safe('<!--edit-link-->')
+
+
+def render_card(post):
+    head, tail = render_to_string('post_card.html', {'post': post, 'edit_link': EDIT_LINK}).split(EDIT_LINK, 1)
+    return head, tail
+
+
+def edit_link(post, user):
+    if user is None or not user.is_authenticated or user.pk != post.author_id:
+        return ''
+    return render_to_string('post_edit_link.html', {'post': post})
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """Карточки постов ленты.
+
+    Общие части карточек берутся из кэша одним get_many, недостающие
+    отрисовываются и кладутся одним set_many; ссылка на редактирование
+    вставляется для каждого читателя своя.
+    """
+    posts = list(posts)
+    card_generation = generation('card')
+    keys = [card_key(post, card_generation) for post in posts]
+    cached = cache.get_many(keys)
+    rendered = {}
+    user = context.get('user')
+    html = []
+    for post, key in zip(posts, keys):
+        parts = cached.get(key)
+        if parts is None:
+            parts = rendered[key] = render_card(post)
+        head, tail = parts
+        html += [head, edit_link(post, user), tail]
+    if rendered:
+        cache.set_many(rendered, settings.CARD_CACHE_TIMEOUT)
+    return mark_safe(''.join(html))
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    return post_cards(context, [post])
@@ -1,8 +1,44 @@
-from django.test import TestCase, Client
+import gzip
+import json
+import marshal
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template import Context as TemplateContext, Template
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models.signals import pre_delete
+from django.test.utils import CaptureQueriesContext
+
+from yatube import metrics as node_metrics, replicas, slow_queries
+from yatube.instrumentation import Metrics
+from yatube.sqlite_cache import SQLiteCache
+from yatube.tiered_cache import TwoTierCache
 
-from .models import User, Group, Post, Follow, Comment
+from . import profiler
+from .cache import Entry, bump, fetch, generation_key
+from .templatetags import post_cards
+from .management.commands import import_yatube, sync_replica
+from .middleware import AnonymousPageCacheMiddleware, page_key
+from .models import (
+    User, Group, Post, Follow, Comment, AuthorStats, PostThumbnail, PulledAuthor, TimelineEntry, ProfileRecord,
+    ImportSource,
+)
 
 
 class TestPosts(TestCase):
@@ -105,10 +141,19 @@ class TestPosts(TestCase):
         self.unauth_user_client.post(reverse('new_post'), {'text': self.text, 'group': self.group.id}, follow=True)
         self.assertEqual(Post.objects.count(), 0)
 
+    def test_post_view_loads_group_with_post(self):
+        post = Post.objects.create(text=self.text, group=self.group, author=self.user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('post', kwargs={'username': self.user.username, 'post_id': post.id}))
+        self.assertContains(response, self.group.title)
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'FROM "posts_group"' in q['sql']])
+
     def test_page_not_found(self):
         response = self.client.get(reverse('profile', kwargs={'username': 'sdfsdf'}))
         self.assertEqual(response.status_code, 404)
 
+    @override_settings(THUMBNAIL_WORKERS=0)
     def test_image_existence(self):
         with open('posts/test_image.jpg', 'rb') as img:
             self.client.post(
@@ -143,19 +188,38 @@ class TestPosts(TestCase):
 
         self.assertEqual(Post.objects.filter(image__isnull=False).count(), 0)
 
+    @override_settings(THUMBNAIL_WORKERS=0)
     def test_cashe(self):
+        post = Post.objects.create(text=self.text, group=self.group, author=self.user)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, self.text)
+
+        Post.objects.filter(pk=post.pk).update(text=self.new_text)
         response = self.client.get(reverse('index'))
+        self.assertContains(response, self.text)
+        self.assertNotContains(response, self.new_text)
+
         with open('posts/test_image.jpg', 'rb') as img:
             self.client.post(
                 reverse('new_post'),
-                {'text': self.text, 'group': self.group.id, 'image': img},
+                {'text': self.new_text, 'group': self.group.id, 'image': img},
                 follow=True,
             )
         response = self.client.get(reverse('index'))
 
-        self.assertNotContains(response, '<img')
+        self.assertContains(response, '<img')
         self.assertNotContains(response, self.text)
 
+    def test_cache_varies_by_page(self):
+        for i in range(11):
+            Post.objects.create(text=f'{self.text} {i:02}', author=self.user)
+
+        first = self.client.get(reverse('index'))
+        second = self.client.get(reverse('index'), {'after': first.context['page'].next_cursor})
+        self.assertContains(first, f'{self.text} 10')
+        self.assertNotContains(second, f'{self.text} 10')
+        self.assertContains(second, f'{self.text} 00')
+
     def test_authorized_follow_unfollow(self):
         new_user = User.objects.create_user(
             first_name='Van',
@@ -212,3 +276,1325 @@ class TestPosts(TestCase):
             follow=True
         )
         self.assertEqual(Comment.objects.count(), 1)
+
+
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Paged', password='Zxcvb12345')
+        self.client = Client()
+        self.posts = [
+            Post.objects.create(text=f'Тестовый пост {i}', author=self.user)
+            for i in range(25)
+        ]
+        self.expected = [post.id for post in sorted(self.posts, key=lambda p: (p.pub_date, p.id), reverse=True)]
+        cache.clear()
+
+    def walk(self, url):
+        seen = []
+        page = self.client.get(url).context['page']
+        seen.extend(post.id for post in page)
+        while page.next_cursor:
+            page = self.client.get(url, {'after': page.next_cursor}).context['page']
+            seen.extend(post.id for post in page)
+        return seen, page
+
+    def test_cursor_walk(self):
+        for url in (reverse('index'), reverse('profile', kwargs={'username': self.user.username})):
+            seen, last_page = self.walk(url)
+            self.assertEqual(seen, self.expected)
+
+            previous = self.client.get(url, {'before': last_page.previous_cursor}).context['page']
+            self.assertEqual([post.id for post in previous], self.expected[10:20] if url == '/' else self.expected[15:20])
+
+    def test_legacy_page_number(self):
+        page = self.client.get(reverse('index'), {'page': 2}).context['page']
+        self.assertEqual([post.id for post in page], self.expected[10:20])
+        self.assertIsNotNone(page.previous_cursor)
+        self.assertIsNotNone(page.next_cursor)
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        page = self.client.get(reverse('index'), {'after': 'not-a-cursor'}).context['page']
+        self.assertEqual([post.id for post in page], self.expected[:10])
+        self.assertIsNone(page.previous_cursor)
+
+    def test_no_count_query(self):
+        page = self.client.get(reverse('index')).context['page']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'), {'after': page.next_cursor})
+        self.assertFalse([q['sql'] for q in queries if 'COUNT(' in q['sql'] or 'OFFSET' in q['sql']])
+
+
+class TestCommentCount(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Counter', password='Zxcvb12345')
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(text='Тестовый пост', author=self.user)
+        cache.clear()
+
+    def test_add_and_delete(self):
+        self.client.post(
+            reverse('add_comment', kwargs={'username': self.user.username, 'post_id': self.post.id}),
+            {'text': 'Тестовый комментарий'},
+        )
+        comment = Comment.objects.create(text='Ещё комментарий', author=self.user, post=self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+        Comment.objects.filter(post=self.post).delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_post_delete_skips_per_comment_work(self):
+        for i in range(5):
+            Comment.objects.create(text=f'Комментарий {i}', author=self.user, post=self.post)
+        with mock.patch('posts.cache.bump') as bump, CaptureQueriesContext(connection) as queries:
+            self.post.delete()
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith('UPDATE "posts_post"')])
+        self.assertEqual(sorted(call.args[0] for call in bump.call_args_list), ['feed', 'page'])
+        self.assertFalse(Comment.objects.exists())
+
+    def test_failed_post_delete_does_not_leak(self):
+        comment = Comment.objects.create(text='Тестовый комментарий', author=self.user, post=self.post)
+
+        def fail(**kwargs):
+            raise RuntimeError
+
+        pre_delete.connect(fail, sender=Post)
+        try:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.post.delete()
+        finally:
+            pre_delete.disconnect(fail, sender=Post)
+        self.client.get(reverse('index'))
+
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_recount_command(self):
+        Comment.objects.create(text='Тестовый комментарий', author=self.user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=42)
+
+        call_command('recount_comments', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_feed_without_comment_queries(self):
+        for i in range(10):
+            post = Post.objects.create(text=f'Тестовый пост {i}', author=self.user)
+            Comment.objects.create(text='Тестовый комментарий', author=self.user, post=post)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, '1 комментариев')
+        self.assertFalse([q['sql'] for q in queries if 'posts_comment' in q['sql']])
+
+
+class TestTimeline(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='Reader', password='Zxcvb12345')
+        self.author = User.objects.create_user(username='Writer', password='Zxcvb12345')
+        self.star = User.objects.create_user(username='Star', password='Zxcvb12345')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed_ids(self, **params):
+        return [post.id for post in self.client.get(reverse('follow_index'), params).context['page']]
+
+    def test_fan_out_and_follow_backfill(self):
+        old = Post.objects.create(text='Старый пост', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        new = Post.objects.create(text='Новый пост', author=self.author)
+
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 2)
+        self.assertEqual(self.feed_ids(), [new.id, old.id])
+
+        Follow.objects.get(user=self.reader, author=self.author).delete()
+        self.assertEqual(self.feed_ids(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_pulled_author_merged_on_read(self):
+        Follow.objects.create(user=self.reader, author=self.star)
+        posts = [Post.objects.create(text=f'Пост звезды {i}', author=self.star) for i in range(12)]
+
+        self.assertTrue(PulledAuthor.objects.filter(author=self.star).exists())
+        self.assertFalse(TimelineEntry.objects.filter(author=self.star).exists())
+
+        page = self.client.get(reverse('follow_index')).context['page']
+        rest = self.feed_ids(after=page.next_cursor)
+        self.assertEqual([post.id for post in page] + rest, [post.id for post in reversed(posts)])
+
+    def test_large_backfill(self):
+        # SQLite принимает не больше 500 строк в одном INSERT ... UNION ALL.
+        Post.objects.bulk_create(Post(text=f'Пост {i}', author=self.author) for i in range(600))
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 600)
+
+        call_command('rebuild_timelines', self.reader.username, stdout=StringIO())
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 600)
+
+    def test_rebuild_command(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Тестовый пост', author=self.author)
+        TimelineEntry.objects.all().delete()
+
+        call_command('rebuild_timelines', self.reader.username, stdout=StringIO())
+        self.assertEqual(self.feed_ids(), [post.id])
+
+    def test_feed_does_not_join_follow(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text='Тестовый пост', author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('follow_index'))
+        feed_queries = [q['sql'] for q in queries if 'posts_timelineentry' in q['sql']]
+        self.assertEqual(len(feed_queries), 1)
+        self.assertNotIn('posts_follow', feed_queries[0])
+
+
+class TestFeedIndexes(TestCase):
+    def test_explain_feeds(self):
+        user = User.objects.create_user(username='Explained', password='Zxcvb12345')
+        author = User.objects.create_user(username='Explainer', password='Zxcvb12345')
+        group = Group.objects.create(title='test_group', slug='test_group', description='group for test')
+        Follow.objects.create(user=user, author=author)
+        for i in range(30):
+            Post.objects.create(text=f'Тестовый пост {i}', author=author, group=group)
+
+        out = StringIO()
+        call_command('explain_feeds', user=user.username, stdout=out)
+        self.assertIn('post_group_pub_date_idx', out.getvalue())
+        self.assertIn('post_author_pub_date_idx', out.getvalue())
+        self.assertNotIn('USE TEMP B-TREE', out.getvalue())
+
+
+class TestBoundedFeeds(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Prolific', password='Zxcvb12345')
+        self.group = Group.objects.create(title='big_group', slug='big_group', description='big group')
+        Post.objects.bulk_create([
+            Post(text=f'Тестовый пост {i}', author=self.author, group=self.group) for i in range(300)
+        ])
+        self.client = Client()
+        cache.clear()
+
+    def fetched_posts(self, url, params=None):
+        loaded = []
+        original = Post.from_db.__func__
+
+        def from_db(cls, *args, **kwargs):
+            loaded.append(1)
+            return original(cls, *args, **kwargs)
+
+        with mock.patch.object(Post, 'from_db', classmethod(from_db)):
+            response = self.client.get(url, params or {})
+        return len(loaded), response
+
+    def test_rows_fetched_bounded_by_page(self):
+        urls = (
+            (reverse('group', kwargs={'slug': self.group.slug}), 4),
+            (reverse('profile', kwargs={'username': self.author.username}), 5),
+        )
+        for url, per_page in urls:
+            fetched, response = self.fetched_posts(url)
+            self.assertLessEqual(fetched, per_page + 1)
+
+            cursor = response.context['page'].next_cursor
+            for _ in range(10):
+                response = self.client.get(url, {'after': cursor})
+                cursor = response.context['page'].next_cursor
+            fetched, response = self.fetched_posts(url, {'after': cursor})
+            self.assertLessEqual(fetched, per_page + 1)
+            self.assertEqual(len(response.context['page']), per_page)
+
+
+class TestAuthorStats(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Popular', password='Zxcvb12345')
+        self.reader = User.objects.create_user(username='Fan', password='Zxcvb12345')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        self.client.get(reverse('profile_follow', kwargs={'username': self.author.username}))
+        post = Post.objects.create(text='Тестовый пост', author=self.author)
+        self.assertEqual(
+            (self.stats(self.author).followers, self.stats(self.reader).following, self.stats(self.author).posts),
+            (1, 1, 1)
+        )
+
+        post.delete()
+        self.client.get(reverse('profile_unfollow', kwargs={'username': self.author.username}))
+        self.assertEqual(
+            (self.stats(self.author).followers, self.stats(self.reader).following, self.stats(self.author).posts),
+            (0, 0, 0)
+        )
+
+    def test_profile_reads_stats_without_counting(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text='Тестовый пост', author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile', kwargs={'username': self.author.username}))
+        self.assertContains(response, 'Подписчиков: 1')
+        self.assertContains(response, 'Записей: 1')
+        self.assertFalse([q['sql'] for q in queries if 'COUNT(' in q['sql']])
+
+    def test_reconcile_command(self):
+        Post.objects.create(text='Тестовый пост', author=self.author)
+        AuthorStats.objects.filter(user=self.author).update(posts=7, followers=3)
+        AuthorStats.objects.filter(user=self.reader).delete()
+
+        call_command('reconcile_stats', stdout=StringIO())
+        self.assertEqual((self.stats(self.author).posts, self.stats(self.author).followers), (1, 0))
+        self.assertTrue(AuthorStats.objects.filter(user=self.reader).exists())
+
+
+@override_settings(THUMBNAIL_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp())
+class TestThumbnails(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Photographer', password='Zxcvb12345')
+        self.client = Client()
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def upload(self):
+        with open('posts/test_image.jpg', 'rb') as img:
+            self.client.post(reverse('new_post'), {'text': 'Пост с картинкой', 'image': img})
+        return Post.objects.order_by('-id').first()
+
+    def test_generated_on_save(self):
+        post = self.upload()
+        thumbnail = PostThumbnail.objects.get(post=post)
+        self.assertEqual(thumbnail.source, post.image.name)
+        self.assertEqual(len(thumbnail.srcset.split(', ')), 3)
+        self.assertTrue(thumbnail.placeholder.startswith('data:image/jpeg;base64,'))
+
+        with mock.patch('sorl.thumbnail.default.backend.get_thumbnail', side_effect=AssertionError):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, thumbnail.url)
+        self.assertContains(response, 'srcset=')
+
+    def test_stale_thumbnail_regenerated(self):
+        post = self.upload()
+        PostThumbnail.objects.filter(post=post).update(source='posts/old.jpg')
+
+        call_command('generate_thumbnails', stdout=StringIO())
+        self.assertEqual(PostThumbnail.objects.get(post=post).source, post.image.name)
+
+    def test_feed_resolves_thumbnails_in_one_query(self):
+        for _ in range(3):
+            self.upload()
+        Post.objects.create(text='Пост без картинки', author=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'srcset=', count=3)
+        self.assertEqual(len([q for q in queries if 'posts_postthumbnail' in q['sql']]), 1)
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Searcher', password='Zxcvb12345')
+        self.client = Client()
+        self.cats = Post.objects.create(text='Котики спят на солнышке', author=self.user)
+        self.dogs = Post.objects.create(text='Собаки любят гулять', author=self.user)
+        self.cat = Post.objects.create(text='Мой котик и его игрушки', author=self.user)
+
+    def test_stemmed_search(self):
+        response = self.client.get(reverse('search'), {'q': 'котиков'})
+        self.assertEqual({post.id for post in response.context['page']}, {self.cats.id, self.cat.id})
+        self.assertNotContains(response, 'Собаки')
+
+    def test_index_follows_edits_and_deletes(self):
+        self.dogs.text = 'Теперь и собаки, и котики'
+        self.dogs.save()
+        self.cats.delete()
+        ids = [result['id'] for result in self.client.get(reverse('api_search'), {'q': 'котик'}).json()['results']]
+        self.assertEqual(set(ids), {self.dogs.id, self.cat.id})
+
+    def test_api_cursor_pagination(self):
+        for i in range(25):
+            Post.objects.create(text=f'Котик номер {i}', author=self.user)
+        first = self.client.get(reverse('api_search'), {'q': 'котик'}).json()
+        second = self.client.get(reverse('api_search'), {'q': 'котик', 'after': first['next']}).json()
+        ids = [result['id'] for result in first['results'] + second['results']]
+        self.assertEqual(len(ids), 27)
+        self.assertEqual(len(set(ids)), 27)
+        self.assertIsNone(second['next'])
+
+    def test_api_limit(self):
+        response = self.client.get(reverse('api_search'), {'q': 'котик', 'limit': 1}).json()
+        self.assertEqual(len(response['results']), 1)
+        self.assertIsNotNone(response['next'])
+
+    def test_syntax_is_not_injected(self):
+        response = self.client.get(reverse('api_search'), {'q': 'котик" OR NEAR(*'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_uses_index(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'Zxcvb12345')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/posts/post/', {'q': 'котики'})
+        self.assertContains(response, f'/admin/posts/post/{self.cat.id}/change/')
+        self.assertNotContains(response, f'/admin/posts/post/{self.dogs.id}/change/')
+        self.assertFalse([q['sql'] for q in queries if 'LIKE' in q['sql'] and 'posts_post' in q['sql']])
+
+    def test_admin_query_without_words(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'Zxcvb12345')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/posts/post/', {'q': '!!!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, f'/admin/posts/post/{self.cat.id}/change/')
+
+
+class TestAnonymousPageCache(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Cached', password='Zxcvb12345')
+        self.post = Post.objects.create(text='Тестовый пост', author=self.user)
+        self.client = Client()
+        cache.clear()
+
+    def test_hit_miss_and_invalidation(self):
+        url = reverse('post', kwargs={'username': self.user.username, 'post_id': self.post.id})
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+
+        Comment.objects.create(text='Новый комментарий', author=self.user, post=self.post)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Новый комментарий')
+
+        reader = User.objects.create_user(username='Follower', password='Zxcvb12345')
+        profile = reverse('profile', kwargs={'username': self.user.username})
+        self.client.get(profile)
+        Follow.objects.create(user=reader, author=self.user)
+        self.assertContains(self.client.get(profile), 'Подписчиков: 1')
+
+    def test_query_string_normalized(self):
+        self.assertEqual(self.client.get('/?a=1&b=2')['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/?b=2&a=1')['X-Page-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/?b=3&a=1')['X-Page-Cache'], 'MISS')
+
+    def test_authenticated_bypass(self):
+        self.client.force_login(self.user)
+        url = reverse('post', kwargs={'username': self.user.username, 'post_id': self.post.id})
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'BYPASS')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_csrf_pages_not_cached(self):
+        request = RequestFactory().get(reverse('index'))
+        request.user = AnonymousUser()
+        middleware = AnonymousPageCacheMiddleware(lambda request: HttpResponse('<form>'))
+        request.META['CSRF_COOKIE_USED'] = True
+
+        self.assertEqual(middleware(request)['X-Page-Cache'], 'BYPASS')
+        self.assertEqual(middleware(request)['X-Page-Cache'], 'BYPASS')
+
+
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Conditional', password='Zxcvb12345')
+        self.post = Post.objects.create(text='Тестовый пост', author=self.user)
+        self.url = reverse('post', kwargs={'username': self.user.username, 'post_id': self.post.id})
+        self.client = Client()
+        cache.clear()
+
+    def test_post_not_modified(self):
+        response = self.client.get(self.url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_post_validator_follows_changes(self):
+        etag = self.client.get(self.url)['ETag']
+        Comment.objects.create(text='Комментарий', author=self.user, post=self.post)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Комментарий')
+
+        etag = response['ETag']
+        Follow.objects.create(user=User.objects.create_user(username='Reader'), author=self.user)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_post_validator_depends_on_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_post_validator_depends_on_csrf_token(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Новый вход меняет токен: форма из кэша браузера больше не годится.
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = get_token(RequestFactory().get('/'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_feed_not_modified_until_write(self):
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Post.objects.create(text='Свежий пост', author=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Свежий пост')
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class TestCommentPages(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Commenter', password='Zxcvb12345')
+        self.post = Post.objects.create(text='Тестовый пост', author=self.user)
+        Comment.objects.bulk_create(
+            Comment(text=f'Комментарий {i}', author=self.user, post=self.post) for i in range(7)
+        )
+        Post.objects.filter(pk=self.post.pk).update(comment_count=7)
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.url = reverse('comments', kwargs={'username': self.user.username, 'post_id': self.post.id})
+        cache.clear()
+
+    def test_post_shows_first_chunk(self):
+        response = self.client.get(reverse('post', kwargs={'username': self.user.username, 'post_id': self.post.id}))
+        self.assertEqual(len(response.context['comments']), 3)
+        self.assertIsNotNone(response.context['comments_cursor'])
+        self.assertContains(response, 'Показать ещё')
+        self.assertNotContains(response, 'Комментарий 3')
+
+    def test_load_more_walks_all_comments(self):
+        texts, cursor = [], ''
+        while True:
+            data = self.client.get(self.url, {'after': cursor, 'format': 'json'}).json()
+            texts += [comment['text'] for comment in data['results']]
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(texts, [f'Комментарий {i}' for i in range(7)])
+
+    def test_fragment(self):
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'comment_list.html')
+        self.assertContains(response, 'Комментарий 0')
+        self.assertContains(response, '?after=')
+
+    def test_add_comment_does_not_load_comments(self):
+        url = reverse('add_comment', kwargs={'username': self.user.username, 'post_id': self.post.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'text': 'Ещё один комментарий'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse([query for query in queries if 'FROM "posts_comment"' in query['sql']])
+
+        response = self.client.post(url, {'text': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+        self.assertEqual(len(response.context['comments']), 3)
+
+
+@override_settings(API_PAGE_SIZE=4)
+class TestApi(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ApiAuthor', password='Zxcvb12345')
+        self.reader = User.objects.create_user(username='ApiReader', password='Zxcvb12345')
+        self.group = Group.objects.create(title='Группа', slug='api_group')
+        self.posts = [
+            Post.objects.create(text=f'Пост {i}', author=self.user, group=self.group if i % 2 else None)
+            for i in range(10)
+        ]
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.client = Client()
+        cache.clear()
+
+    def walk(self, url, **params):
+        ids, cursor = [], ''
+        while True:
+            data = self.client.get(url, {**params, 'after': cursor}).json()
+            ids += [row['id'] for row in data['results']]
+            cursor = data['next']
+            if not cursor:
+                return ids
+
+    def test_feeds(self):
+        newest_first = [post.id for post in reversed(self.posts)]
+        self.assertEqual(self.walk(reverse('api_index')), newest_first)
+        self.assertEqual(self.walk(reverse('api_profile', kwargs={'username': self.user.username})), newest_first)
+        self.assertEqual(
+            self.walk(reverse('api_group', kwargs={'slug': self.group.slug})),
+            [post.id for post in reversed(self.posts) if post.group_id]
+        )
+        self.client.force_login(self.reader)
+        self.assertEqual(self.walk(reverse('api_follow')), newest_first)
+
+    def test_field_selection(self):
+        data = self.client.get(reverse('api_index'), {'fields': 'id,author'}).json()
+        self.assertEqual(data['results'][0], {'id': self.posts[-1].id, 'author': self.user.username})
+        self.assertEqual(self.client.get(reverse('api_index'), {'fields': 'id,password'}).status_code, 400)
+
+        post = self.client.get(reverse('api_post', kwargs={'post_id': self.posts[0].id})).json()
+        self.assertEqual(post['text'], 'Пост 0')
+        self.assertIsNone(post['group'])
+
+    def test_comments(self):
+        post = self.posts[0]
+        for i in range(6):
+            Comment.objects.create(text=f'Комментарий {i}', author=self.reader, post=post)
+        ids = self.walk(reverse('api_comments', kwargs={'post_id': post.id}), fields='id')
+        self.assertEqual(ids, list(post.comments.order_by('created', 'id').values_list('id', flat=True)))
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(reverse('api_follow')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('api_post', kwargs={'post_id': 999})).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_group', kwargs={'slug': 'nope'})).status_code, 404)
+
+    def test_etag(self):
+        url = reverse('api_post', kwargs={'post_id': self.posts[0].id})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get(url, {'fields': 'id'})['ETag'], etag)
+
+        Comment.objects.create(text='Комментарий', author=self.reader, post=self.posts[0])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_api', repeat=2, stdout=out)
+        self.assertIn('json', out.getvalue())
+
+
+class TestImport(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'dump.jsonl')
+        records = [
+            {'type': 'user', 'username': 'Imported', 'first_name': 'Имя'},
+            {'type': 'group', 'slug': 'imported', 'title': 'Импорт'},
+            {'type': 'post', 'id': 500, 'author': 'Imported', 'group': 'imported',
+             'text': 'Старые котики', 'pub_date': '2015-03-01T12:00:00+00:00'},
+            {'type': 'post', 'id': 501, 'author': 'Imported', 'text': 'Второй пост', 'pub_date': '2015-03-02T12:00:00'},
+            {'type': 'comment', 'post': 500, 'author': 'Reader', 'text': 'Комментарий', 'created': '2015-03-03T12:00:00'},
+            {'type': 'comment', 'post': 999, 'author': 'Reader', 'text': 'К несуществующему посту'},
+            {'type': 'follow', 'user': 'Reader', 'author': 'Imported'},
+        ]
+        with open(self.path, 'w') as stream:
+            stream.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+
+    def test_import(self):
+        out = StringIO()
+        call_command('import_yatube', self.path, batch_size=3, stdout=out)
+
+        post = Post.objects.get(pk=500)
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(post.group.slug, 'imported')
+        self.assertEqual(post.author.first_name, 'Имя')
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(Comment.objects.get().created.year, 2015)
+
+        reader = User.objects.get(username='Reader')
+        self.assertEqual(AuthorStats.objects.get(pk=post.author_id).followers, 1)
+        self.assertEqual(TimelineEntry.objects.filter(user=reader).count(), 2)
+        self.assertContains(self.client.get(reverse('search'), {'q': 'котик'}), 'Старые котики')
+
+        self.assertIn('пропущено 1', out.getvalue())
+        self.assertEqual(ImportSource.objects.get(name=self.path).records, 7)
+
+    def test_resume_after_failed_batch(self):
+        flush_comments = import_yatube.Command.flush_comments
+
+        def failing(command):
+            if command.buffers['comment']:
+                raise RuntimeError('сбой посреди пачки')
+            flush_comments(command)
+
+        with mock.patch.object(import_yatube.Command, 'flush_comments', failing), self.assertRaises(RuntimeError):
+            call_command('import_yatube', self.path, batch_size=3, stdout=StringIO())
+        self.assertEqual(ImportSource.objects.get(name=self.path).records, 3)
+        self.assertEqual(list(Post.objects.values_list('pk', flat=True)), [500])
+
+        out = StringIO()
+        call_command('import_yatube', self.path, batch_size=3, stdout=out)
+        self.assertIn('Продолжаем после записи 3', out.getvalue())
+        self.assertEqual(sorted(Post.objects.values_list('pk', flat=True)), [500, 501])
+        self.assertEqual(Comment.objects.get().post_id, 500)
+
+    def test_rerun_does_not_duplicate(self):
+        call_command('import_yatube', self.path, stdout=StringIO())
+        out = StringIO()
+        call_command('import_yatube', self.path, stdout=out)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertIn('post: 0, comment: 0', out.getvalue())
+
+    def test_taken_id_is_remapped(self):
+        owner = User.objects.create_user(username='Owner', password='Zxcvb12345')
+        Post.objects.create(pk=500, text='Чужой пост', author=owner)
+        out = StringIO()
+        call_command('import_yatube', self.path, stdout=out)
+
+        self.assertEqual(Post.objects.get(pk=500).text, 'Чужой пост')
+        self.assertFalse(Comment.objects.filter(post_id=500).exists())
+        imported = Post.objects.get(text='Старые котики')
+        self.assertNotEqual(imported.pk, 500)
+        self.assertEqual(Comment.objects.get().post, imported)
+        self.assertIn('post: 2', out.getvalue())
+        self.assertIn('под новым id: 1', out.getvalue())
+        self.assertNotContains(self.client.get(reverse('search'), {'q': 'котик'}), 'Чужой пост')
+
+    def test_same_text_is_not_merged(self):
+        path = os.path.join(self.directory, 'same.jsonl')
+        records = [
+            {'type': 'post', 'id': 1, 'author': 'Same', 'text': '+1'},
+            {'type': 'post', 'id': 2, 'author': 'Same', 'text': '+1'},
+            {'type': 'comment', 'post': 2, 'author': 'Same', 'text': '+1'},
+            {'type': 'comment', 'post': 2, 'author': 'Same', 'text': '+1'},
+        ]
+        with open(path, 'w') as stream:
+            stream.writelines(json.dumps(record) + '\n' for record in records)
+        out = StringIO()
+        call_command('import_yatube', path, stdout=out)
+        self.assertIn('post: 2, comment: 2, follow: 0; пропущено 0', out.getvalue())
+        self.assertEqual(Comment.objects.filter(post_id=2).count(), 2)
+
+    def test_csv(self):
+        path = os.path.join(self.directory, 'posts.csv')
+        with open(path, 'w') as stream:
+            stream.write('type,id,author,group,text,pub_date\npost,7,Csv,,Пост из CSV,2016-01-01T00:00:00\n')
+        call_command('import_yatube', path, stdout=StringIO())
+        self.assertEqual(Post.objects.get(pk=7).author.username, 'Csv')
+        self.assertIsNone(Post.objects.get(pk=7).group)
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Exported', password='Zxcvb12345')
+        self.reader = User.objects.create_user(username='Reader', password='Zxcvb12345')
+        self.group = Group.objects.create(title='Группа', slug='exported', description='Описание')
+        self.posts = [
+            Post.objects.create(text=f'Пост {i}', author=self.author, group=self.group if i % 2 else None)
+            for i in range(5)
+        ]
+        Comment.objects.create(text='Комментарий', author=self.reader, post=self.posts[0])
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.directory = tempfile.mkdtemp()
+
+    def test_round_trip_through_import(self):
+        path = os.path.join(self.directory, 'dump.jsonl.gz')
+        call_command('export_yatube', tables='user,group,post,comment,follow', output=path, chunk_size=2,
+                     stdout=StringIO())
+        pub_dates = list(Post.objects.order_by('pk').values_list('pub_date', flat=True))
+
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        call_command('import_yatube', path, stdout=StringIO())
+
+        self.assertEqual(list(Post.objects.order_by('pk').values_list('pub_date', flat=True)), pub_dates)
+        self.assertEqual(Post.objects.get(pk=self.posts[1].pk).group, self.group)
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).comment_count, 1)
+        self.assertTrue(Follow.objects.filter(user=self.reader, author=self.author).exists())
+
+    def test_csv(self):
+        path = os.path.join(self.directory, 'dump.csv')
+        call_command('export_yatube', format='csv', output=path, stdout=StringIO())
+        with open(path) as stream:
+            lines = stream.read().splitlines()
+        self.assertTrue(lines[0].startswith('type,id,author,group,text'))
+        self.assertEqual(len(lines), 1 + 5 + 1 + 1)
+
+    def test_endpoint_is_staff_only_and_streams(self):
+        url = reverse('export')
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.reader.is_staff = True
+        self.reader.save()
+        response = self.client.get(url, {'tables': 'post', 'gzip': '1'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [post.id for post in self.posts])
+
+        self.assertEqual(self.client.get(url, {'tables': 'auth_user'}).status_code, 400)
+
+
+class TestBenchmarks(TestCase):
+    def test_seed_is_reproducible(self):
+        options = {'users': 5, 'groups': 2, 'posts': 30, 'comments': 40, 'follows': 10, 'images': 0, 'stdout': StringIO()}
+        call_command('seed_yatube', **options)
+        first = list(Post.objects.order_by('pk').values_list('text', 'author__username', 'pub_date'))
+        self.assertEqual(len(first), 30)
+        self.assertEqual(Comment.objects.count(), 40)
+
+        self.assertFalse(ImportSource.objects.exists())
+        call_command('seed_yatube', prefix='again', **options)
+        second = list(Post.objects.order_by('pk').values_list('text', 'pub_date'))[30:]
+        self.assertEqual(second, [(text, pub_date) for text, _, pub_date in first])
+
+    def test_bench_views_writes_json(self):
+        call_command('seed_yatube', users=5, groups=2, posts=30, comments=40, follows=10, images=0, stdout=StringIO())
+        output = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        out = StringIO()
+        counts = [Post.objects.count(), Comment.objects.count(), Follow.objects.count()]
+        call_command('bench_views', requests=3, concurrency=1, warmup=0, output=output, stdout=out, stderr=StringIO())
+        self.assertEqual([Post.objects.count(), Comment.objects.count(), Follow.objects.count()], counts)
+
+        with open(output) as stream:
+            run = json.load(stream)
+        self.assertEqual(run['dataset']['posts'], Post.objects.filter(text__contains=' ').count())
+        for name, result in run['routes'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertIn('follow_index', run['routes'])
+        self.assertIn('new_post', run['routes'])
+
+    def test_unfollow_without_follow(self):
+        user = User.objects.create_user(username='Lonely', password='Zxcvb12345')
+        author = User.objects.create_user(username='Author', password='Zxcvb12345')
+        self.client.force_login(user)
+        response = self.client.get(reverse('profile_unfollow', kwargs={'username': author.username}))
+        self.assertRedirects(response, reverse('profile', kwargs={'username': author.username}))
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Measured', password='Zxcvb12345')
+        self.post = Post.objects.create(text='Тестовый пост', author=self.user)
+        self.url = reverse('post', kwargs={'username': self.user.username, 'post_id': self.post.id})
+        cache.clear()
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertRegex(timing, r'template;dur=\d+\.\d')
+        self.assertRegex(timing, r'cache;desc="\d+ hits, [1-9]\d* misses"')
+
+    def test_log_line_names_view(self):
+        with self.assertLogs('yatube.requests', 'INFO') as logs:
+            self.client.get(self.url)
+            self.client.get(self.url)
+        first, second = (json.loads(record.getMessage()) for record in logs.records)
+        self.assertEqual(first['view'], 'post')
+        self.assertGreater(first['queries'], 0)
+        # Второй ответ отдан кэшем страниц: без SQL и шаблонов, но с именем вида.
+        self.assertEqual(second['view'], 'post')
+        self.assertEqual(second['queries'], 0)
+        self.assertEqual(second['template_ms'], 0)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_header_can_be_disabled(self):
+        self.assertFalse(self.client.get(self.url).has_header('Server-Timing'))
+
+
+@override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_LOG_INTERVAL=60)
+class TestSlowQueries(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Slow', password='Zxcvb12345')
+        Post.objects.create(text='Тестовый пост', author=self.user)
+        slow_queries.sampler.seen.clear()
+        cache.clear()
+
+    def logged(self, logs):
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_logged_with_view_and_plan(self):
+        with self.assertLogs('yatube.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('profile', kwargs={'username': self.user.username}))
+        entries = self.logged(logs)
+        feed = next(entry for entry in entries if 'FROM "posts_post"' in entry['sql'])
+        self.assertEqual(feed['view'], 'profile')
+        self.assertTrue(feed['source'].startswith('posts/'))
+        self.assertTrue(any('post_author_pub_date_idx' in line for line in feed['plan']))
+        self.assertIn(self.user.id, feed['params'])
+
+    def test_same_shape_logged_once(self):
+        url = reverse('profile', kwargs={'username': self.user.username})
+        with self.assertLogs('yatube.slow_queries', 'WARNING') as logs:
+            self.client.get(url)
+            self.client.get(url, {'page': 2})
+        shapes = [slow_queries.shape(entry['sql']) for entry in self.logged(logs)]
+        self.assertEqual(len(shapes), len(set(shapes)))
+
+    def test_template_line(self):
+        metrics = Metrics()
+        template = Template('{% for user in users %}\n{{ user.username }}{% endfor %}')
+        with self.assertLogs('yatube.slow_queries', 'WARNING') as logs:
+            with connection.execute_wrapper(metrics.execute):
+                template.render(TemplateContext({'users': User.objects.all()}))
+        self.assertEqual(self.logged(logs)[0]['template'], '<unknown source>:1')
+
+    @override_settings(SLOW_QUERY_MS=None)
+    def test_disabled(self):
+        with mock.patch('yatube.slow_queries.report') as report:
+            self.client.get(reverse('index'))
+        report.assert_not_called()
+
+
+class TestNodeMetrics(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(METRICS_DIR=self.directory, METRICS_FLUSH_INTERVAL=0)
+        self.settings_override.enable()
+        node_metrics.registry.reset()
+        self.user = User.objects.create_user(username='Metered', password='Zxcvb12345')
+        Post.objects.create(text='Тестовый пост', author=self.user)
+        cache.clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        node_metrics.registry.reset()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_histogram_and_caches(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        text = self.scrape()
+
+        self.assertIn('yatube_requests_total{status="200",view="index"} 2', text)
+        self.assertIn('yatube_request_duration_seconds_bucket{view="index",le="+Inf"} 2', text)
+        self.assertIn('yatube_request_duration_seconds_count{view="index"} 2', text)
+        self.assertIn('yatube_cache_requests_total{cache="page",result="hit"} 1', text)
+        self.assertIn('yatube_cache_requests_total{cache="page",result="miss"} 1', text)
+        self.assertIn('yatube_cache_requests_total{cache="fragment",result="miss"} 1', text)
+        self.assertRegex(text, r'yatube_db_queries_total\{view="index"\} [1-9]')
+
+    def test_cache_tiers(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        text = self.scrape()
+        self.assertRegex(text, r'yatube_cache_tier_requests_total\{result="hit",tier="l1"\} [1-9]')
+        self.assertRegex(text, r'yatube_cache_tier_requests_total\{result="miss",tier="l2"\} [1-9]')
+
+    def test_processes_are_summed(self):
+        self.client.get(reverse('index'))
+        other = {
+            'counters': [['yatube_requests_total', [['status', '200'], ['view', 'index']], 5]],
+            'histograms': [],
+        }
+        with open(os.path.join(self.directory, '1-1.json'), 'w') as stream:
+            json.dump(other, stream)
+        self.assertIn('yatube_requests_total{status="200",view="index"} 6', self.scrape())
+
+    def test_dead_processes_are_archived(self):
+        self.client.get(reverse('index'))
+        finished = subprocess.Popen([sys.executable, '-c', ''])
+        finished.wait()
+        other = {
+            'counters': [['yatube_requests_total', [['status', '200'], ['view', 'index']], 5]],
+            'histograms': [],
+        }
+        with open(os.path.join(self.directory, f'{finished.pid}-1.json'), 'w') as stream:
+            json.dump(other, stream)
+
+        self.assertIn('yatube_requests_total{status="200",view="index"} 6', self.scrape())
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f'{finished.pid}-1.json')))
+        self.assertIn('yatube_requests_total{status="200",view="index"} 6', self.scrape())
+
+    def test_fork_starts_own_file(self):
+        node_metrics.registry.inc('yatube_requests_total', {'view': 'index', 'status': 200})
+        node_metrics.registry.flush(force=True)
+        node_metrics.registry.pid = -1
+        node_metrics.registry.inc('yatube_requests_total', {'view': 'index', 'status': 200})
+        node_metrics.registry.flush(force=True)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    @override_settings(METRICS_ALLOWED_IPS=('10.0.0.1',))
+    def test_forbidden_for_other_addresses(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+class TestProfiler(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='Staff', password='Zxcvb12345', is_staff=True)
+        self.user = User.objects.create_user(username='Slowpoke', password='Zxcvb12345')
+        Post.objects.create(text='Тестовый пост', author=self.user)
+        self.url = reverse('profile', kwargs={'username': self.user.username})
+        cache.clear()
+
+    def test_staff_query_flag(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {'_profile': 'cprofile'})
+        record = ProfileRecord.objects.get()
+        self.assertEqual(response['X-Profile'], str(record.pk))
+        self.assertEqual((record.user, record.view, record.status), (self.staff, 'profile', 200))
+        self.assertGreater(record.queries, 0)
+        self.assertIn('posts/views.py', record.summary)
+        self.assertTrue(any(name == 'profile' for _, _, name in marshal.loads(bytes(record.data))))
+
+    def test_sampling_profile_is_collapsed_stacks(self):
+        self.client.force_login(self.staff)
+        with override_settings(PROFILER_SAMPLE_INTERVAL=0.0001):
+            self.client.get(self.url, {'_profile': 'sample'})
+        record = ProfileRecord.objects.get()
+        self.assertEqual(record.kind, ProfileRecord.SAMPLE)
+        lines = bytes(record.data).decode().splitlines()
+        self.assertTrue(lines)
+        self.assertIn('Сэмплов:', record.summary)
+        for line in lines:
+            self.assertRegex(line, r'^\S+(;\S+)* \d+$')
+
+    def test_ignored_for_others(self):
+        self.client.get(self.url, {'_profile': 'cprofile'})
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, {'_profile': 'cprofile'})
+        self.assertFalse(response.has_header('X-Profile'))
+        self.client.get(self.url, HTTP_X_YATUBE_PROFILE='forged')
+        self.assertFalse(ProfileRecord.objects.exists())
+
+    def test_signed_header(self):
+        token = profiler.make_token(self.staff)
+        response = self.client.get(self.url, HTTP_X_YATUBE_PROFILE=token)
+        self.assertEqual(ProfileRecord.objects.get().user, self.staff)
+        # Профилируемый запрос не берётся из кэша страниц и не кладётся в него.
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.staff.is_staff = False
+        self.staff.save()
+        cache.clear()
+        self.client.get(self.url, HTTP_X_YATUBE_PROFILE=token)
+        self.assertEqual(ProfileRecord.objects.count(), 1)
+
+    def test_rate_limit(self):
+        self.client.force_login(self.staff)
+        self.client.get(self.url, {'_profile': 'cprofile'})
+        response = self.client.get(self.url, {'_profile': 'cprofile'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Profile'], 'rate-limited')
+        self.assertEqual(ProfileRecord.objects.count(), 1)
+
+    def test_admin_download(self):
+        self.staff.is_superuser = True
+        self.staff.save()
+        self.client.force_login(self.staff)
+        self.client.get(self.url, {'_profile': 'cprofile'})
+        record = ProfileRecord.objects.get()
+        self.assertContains(self.client.get(reverse('admin:posts_profilerecord_changelist')), record.filename)
+        response = self.client.get(reverse('admin:posts_profilerecord_download', args=[record.pk]))
+        self.assertEqual(response.content, bytes(record.data))
+        self.assertIn(record.filename, response['Content-Disposition'])
+
+    def test_token_command(self):
+        out = StringIO()
+        call_command('profile_token', self.staff.username, stdout=out)
+        token = out.getvalue().splitlines()[0].split(': ', 1)[1]
+        self.assertEqual(profiler.token_user(token), self.staff)
+
+
+@override_settings(DATABASE_REPLICAS=['default'])
+class TestReplicas(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Writer', password='Zxcvb12345')
+        Post.objects.create(text='Тестовый пост', author=self.user)
+        cache.clear()
+        replicas.mark_synced('default', time.time())
+        patcher = mock.patch.object(replicas, 'pick', return_value='default')
+        self.pick = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_feed_reads_from_replica(self):
+        response = self.client.get(reverse('index'))
+        self.assertTrue(self.pick.called)
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    def test_other_views_read_from_primary(self):
+        self.client.get(reverse('metrics'))
+        self.client.get(reverse('signup'))
+        self.assertFalse(self.pick.called)
+
+    def test_writer_sticks_to_primary(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('new_post'), {'text': 'Свежий пост'})
+        self.assertRedirects(response, reverse('index'))
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        self.pick.reset_mock()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Свежий пост')
+        self.assertFalse(self.pick.called)
+
+    def test_everyone_reads_primary_right_after_write(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('new_post'), {'text': 'Свежий пост'})
+        self.pick.reset_mock()
+        self.client_class().get(reverse('api_index'))
+        self.assertFalse(self.pick.called)
+
+        replicas.mark_synced('default', time.time())
+        self.client_class().get(reverse('api_search'), {'q': 'пост'})
+        self.assertTrue(self.pick.called)
+
+    def test_lagging_replica_is_skipped(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('new_post'), {'text': 'Свежий пост'})
+        with override_settings(DATABASE_REPLICAS=['default', 'lagging']):
+            replicas.mark_synced('default', time.time())
+            self.client_class().get(reverse('api_index'))
+        self.pick.assert_called_with(['default'])
+
+
+class TestSyncReplica(TransactionTestCase):
+    # backup API не копирует базу из открытой транзакции, поэтому без TestCase.
+    def test_copies_database(self):
+        Post.objects.create(text='Тестовый пост', author=User.objects.create_user(username='Writer'))
+        target = os.path.join(tempfile.mkdtemp(), 'replica.sqlite3')
+        call_command('sync_replica', to=target, stdout=StringIO())
+        with sqlite3.connect(target) as replica:
+            self.assertEqual(replica.execute('SELECT text FROM posts_post').fetchall(), [('Тестовый пост',)])
+
+    def test_records_sync_time(self):
+        target = os.path.join(tempfile.mkdtemp(), 'replica.sqlite3')
+        started = time.time()
+        sync_replica.Command().sync(connection, {'replica1': target})
+        self.assertGreaterEqual(caches['shared'].get(replicas.synced_key('replica1')), started)
+
+
+class TestTwoTierCache(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        node_metrics.registry.reset()
+        options = {'L2': 'shared', 'MAX_ENTRIES': 2, 'SYNC_INTERVAL': 0}
+        # Два бэкенда с разными L1 над одним L2 — как два воркера.
+        self.first = TwoTierCache('first', {'OPTIONS': options})
+        self.second = TwoTierCache('second', {'OPTIONS': options})
+
+    def tier_count(self, tier, result):
+        key = ('yatube_cache_tier_requests_total', node_metrics.label_key({'tier': tier, 'result': result}))
+        return node_metrics.registry.counters[key]
+
+    def test_reads_fill_local_tier(self):
+        self.first.set('key', {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertIsNone(self.second.get('absent'))
+        self.assertEqual((self.tier_count('l1', 'hit'), self.tier_count('l1', 'miss')), (1, 2))
+        self.assertEqual((self.tier_count('l2', 'hit'), self.tier_count('l2', 'miss')), (1, 1))
+
+    def test_invalidation_reaches_other_process(self):
+        self.first.set('generation', 1, None)
+        self.assertEqual(self.second.get('generation'), 1)
+        self.first.incr('generation')
+        self.assertEqual(self.second.get('generation'), 2)
+        self.first.delete('generation')
+        self.assertIsNone(self.second.get('generation'))
+
+    def test_incr_of_evicted_key_reaches_other_process(self):
+        self.first.set('generation', 1, None)
+        self.assertEqual(self.second.get('generation'), 1)
+        caches['shared'].delete('generation')
+        with self.assertRaises(ValueError):
+            self.first.incr('generation')
+        self.assertIsNone(self.second.get('generation'))
+
+    def test_sync_interval_bounds_staleness(self):
+        self.second.sync_interval = 60
+        self.first.set('generation', 1, None)
+        self.assertEqual(self.second.get('generation'), 1)
+        self.first.incr('generation')
+        self.assertEqual(self.second.get('generation'), 1)
+        self.second.tier.synced_at -= 60
+        self.assertEqual(self.second.get('generation'), 2)
+
+    def test_local_tier_is_bounded(self):
+        for key in ('a', 'b', 'c'):
+            self.first.set(key, key)
+        self.assertEqual(len(self.first.tier.entries), 2)
+        self.assertEqual(self.first.get('a'), 'a')
+        self.assertEqual(self.tier_count('l2', 'hit'), 1)
+
+    def test_get_many_fetches_misses_at_once(self):
+        self.first.set_many({'a': 1, 'b': 2})
+        self.second.get('a')
+        with mock.patch.object(caches['shared'], 'get_many', wraps=caches['shared'].get_many) as shared_get_many:
+            self.assertEqual(self.second.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        shared_get_many.assert_called_once_with(['b', 'c'], None)
+
+    def test_add_is_shared(self):
+        self.assertTrue(self.first.add('lock', 1))
+        self.assertFalse(self.second.add('lock', 1))
+
+
+class TestSQLiteCache(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'cache.sqlite3')
+        # Два бэкенда над одним файлом — как два воркера.
+        self.first = SQLiteCache(path, {})
+        self.second = SQLiteCache(path, {})
+
+    def test_values_are_shared(self):
+        self.first.set('post', {'text': 'Пост'})
+        self.first.set('generation', 1, None)
+        self.assertEqual(self.second.get('post'), {'text': 'Пост'})
+        self.assertEqual(self.second.get_many(['generation', 'absent']), {'generation': 1})
+        self.second.delete('post')
+        self.assertIsNone(self.first.get('post'))
+
+    def test_add_is_atomic(self):
+        self.assertTrue(self.first.add('lock', 1))
+        self.assertFalse(self.second.add('lock', 2))
+        self.assertEqual(self.second.get('lock'), 1)
+
+    def test_expired_value_is_replaced(self):
+        self.first.set('lock', 1, 60)
+        with mock.patch('yatube.sqlite_cache.time.time', return_value=time.time() + 120):
+            self.assertIsNone(self.second.get('lock'))
+            self.assertTrue(self.second.add('lock', 2))
+        self.assertEqual(self.first.get('lock'), 2)
+
+    def test_incr(self):
+        self.first.set('generation', 1, None)
+        self.assertEqual(self.second.incr('generation', 2), 3)
+        with self.assertRaises(ValueError):
+            self.second.incr('absent')
+
+    def test_incr_from_threads(self):
+        self.first.set('generation', 0, None)
+
+        def work():
+            for _ in range(50):
+                self.first.incr('generation')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.second.get('generation'), 200)
+
+    def test_size_is_bounded(self):
+        cache = SQLiteCache(self.first.path, {'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2}})
+        for key in 'abcde':
+            cache.set(key, key)
+        self.assertLessEqual(len(cache.get_many('abcde')), 4)
+
+
+class TestPostCards(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Author', password='Zxcvb12345')
+        self.reader = User.objects.create_user(username='Reader', password='Zxcvb12345')
+        self.group = Group.objects.create(title='Старое название', slug='cards')
+        self.posts = [
+            Post.objects.create(text=f'Пост {i}', author=self.author, group=self.group) for i in range(3)
+        ]
+        cache.clear()
+        patcher = mock.patch.object(post_cards, 'render_card', wraps=post_cards.render_card)
+        self.render_card = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_warm_page_is_assembled_from_cached_cards(self):
+        self.client.force_login(self.reader)
+        self.client.get(reverse('index'))
+        self.assertEqual(self.render_card.call_count, 3)
+        bump('feed')
+        self.render_card.reset_mock()
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Пост 2')
+        self.assertFalse(self.render_card.called)
+        get_many.assert_called_once()
+
+    def test_edit_link_is_per_viewer(self):
+        self.client.force_login(self.reader)
+        self.assertNotContains(self.client.get(reverse('index')), 'Редактировать')
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Редактировать', count=3)
+        self.assertEqual(self.render_card.call_count, 3)
+
+    def test_changed_post_is_rendered_again(self):
+        self.client.force_login(self.reader)
+        self.client.get(reverse('index'))
+        self.render_card.reset_mock()
+        Comment.objects.create(post=self.posts[0], author=self.reader, text='Комментарий к посту')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '1 комментариев')
+        self.assertEqual(self.render_card.call_count, 1)
+
+    def test_group_rename_invalidates_cards(self):
+        self.client.get(reverse('index'))
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(self.client.get(reverse('index')), 'Новое название', count=3)
+
+    def test_author_rename_invalidates_pages(self):
+        profile = reverse('profile', kwargs={'username': self.author.username})
+        self.client.get(reverse('index'))
+        self.client.get(profile)
+        self.author.first_name = 'Новое имя'
+        self.author.save()
+        self.assertContains(self.client.get(profile), 'Новое имя')
+
+
+class TestStampede(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.compute = mock.Mock(return_value='новое')
+
+    def test_hit_after_miss(self):
+        self.assertEqual(fetch('key', self.compute, 60), ('новое', 'miss'))
+        self.assertEqual(fetch('key', self.compute, 60), ('новое', 'hit'))
+        self.compute.assert_called_once()
+
+    def test_stale_while_other_recomputes(self):
+        fetch('key:1', lambda: 'прежнее', 60, stale_key='key:latest')
+        cache.add('key:2:lock', True)
+        self.assertEqual(fetch('key:2', self.compute, 60, stale_key='key:latest'), ('прежнее', 'stale'))
+        self.assertFalse(self.compute.called)
+
+    def test_computes_when_nothing_to_serve(self):
+        cache.add('key:lock', True)
+        self.assertEqual(fetch('key', self.compute, 60), ('новое', 'miss'))
+        # Чужая блокировка не снимается.
+        self.assertFalse(cache.add('key:lock', True))
+
+    def test_early_expiration(self):
+        cache.set('key', Entry('прежнее', time.time() + 10, 1.0))
+        with mock.patch('posts.cache.random.random', return_value=0.0):
+            self.assertEqual(fetch('key', self.compute, 60), ('прежнее', 'hit'))
+        with mock.patch('posts.cache.random.random', return_value=0.99999999):
+            self.assertEqual(fetch('key', self.compute, 60), ('новое', 'miss'))
+
+    def test_fresh_value_during_early_refresh(self):
+        cache.set('key', Entry('прежнее', time.time() + 10, 1.0))
+        cache.add('key:lock', True)
+        with mock.patch('posts.cache.random.random', return_value=0.99999999):
+            self.assertEqual(fetch('key', self.compute, 60, allow_stale=False), ('прежнее', 'hit'))
+
+    def test_store_can_refuse(self):
+        self.assertEqual(fetch('key', self.compute, 60, store=lambda value: False), ('новое', 'bypass'))
+        self.assertIsNone(cache.get('key'))
+        self.assertTrue(cache.add('key:lock', True))
+
+    def test_page_cache_serves_stale_page(self):
+        author = User.objects.create_user(username='Hot', password='Zxcvb12345')
+        Post.objects.create(text='Первый пост', author=author)
+        self.assertEqual(self.client.get(reverse('index'))['X-Page-Cache'], 'MISS')
+        Post.objects.create(text='Второй пост', author=author)
+        cache.add(f'{page_key(RequestFactory().get(reverse("index")))}:lock', True)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+        self.assertNotContains(response, 'Второй пост')
+
+    def test_fragment_tag(self):
+        fragment = Template(
+            '{% load feed_cache %}{% feedcache 60 frag generation=generation stale=stale %}{{ value }}{% endfeedcache %}'
+        )
+        self.assertEqual(fragment.render(TemplateContext({'generation': 1, 'value': 'прежнее'})), 'прежнее')
+        cache.add(f'{make_template_fragment_key("frag", [2])}:lock', True)
+        context = {'generation': 2, 'value': 'новое'}
+        self.assertEqual(fragment.render(TemplateContext({**context, 'stale': True})), 'прежнее')
+        self.assertEqual(fragment.render(TemplateContext({**context, 'stale': False})), 'новое')
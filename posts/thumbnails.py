@@ -0,0 +1,105 @@
+import base64
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageFilter
+from sorl.thumbnail import get_thumbnail
+from yatube import metrics
+
+from .models import Post, PostThumbnail
+
+
+logger = logging.getLogger(__name__)
+
+WIDTH, HEIGHT = 960, 339
+SRCSET_WIDTHS = (480, 960, 1440)
+PLACEHOLDER_WIDTH = 24
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+    return _executor
+
+
+def placeholder(image):
+    image.open('rb')
+    try:
+        picture = Image.open(image).convert('RGB')
+        picture.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * HEIGHT // WIDTH))
+        picture = picture.filter(ImageFilter.GaussianBlur(1))
+        buffer = BytesIO()
+        picture.save(buffer, 'JPEG', quality=40)
+    finally:
+        image.close()
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def generate(post_id):
+    post = Post.objects.filter(pk=post_id).only('id', 'image').first()
+    if post is None:
+        return None
+    if not post.image:
+        PostThumbnail.objects.filter(post_id=post_id).delete()
+        return None
+
+    started = time.perf_counter()
+    main = get_thumbnail(post.image, f'{WIDTH}x{HEIGHT}', crop='center', upscale=True)
+    srcset = []
+    for width in SRCSET_WIDTHS:
+        variant = get_thumbnail(post.image, f'{width}x{width * HEIGHT // WIDTH}', crop='center', upscale=True)
+        srcset.append(f'{variant.url} {width}w')
+
+    thumbnail, _ = PostThumbnail.objects.update_or_create(post_id=post_id, defaults={
+        'source': post.image.name,
+        'url': main.url,
+        'width': main.width,
+        'height': main.height,
+        'srcset': ', '.join(srcset),
+        'placeholder': placeholder(post.image),
+    })
+    metrics.registry.observe('yatube_thumbnail_generation_seconds', time.perf_counter() - started)
+    metrics.registry.flush()
+    return thumbnail
+
+
+def run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры поста %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def attach(posts):
+    """Подтягивает миниатюры всех постов страницы одним запросом.
+
+    После вызова post.thumbnail берётся из кэша объекта, и карточки
+    не обращаются к базе по одной.
+    """
+    posts = list(posts)
+    with_images = [post.pk for post in posts if post.image]
+    found = PostThumbnail.objects.in_bulk(with_images) if with_images else {}
+    relation = Post._meta.get_field('thumbnail')
+    for post in posts:
+        relation.set_cached_value(post, found.get(post.pk))
+    return posts
+
+
+def schedule(post):
+    """Готовит миниатюры поста в фоновом пуле после фиксации транзакции.
+
+    При THUMBNAIL_WORKERS = 0 миниатюры готовятся сразу, в текущем потоке.
+    """
+    if not settings.THUMBNAIL_WORKERS:
+        generate(post.pk)
+        return
+    transaction.on_commit(lambda: executor().submit(run, post.pk))
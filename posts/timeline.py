@@ -0,0 +1,99 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import models
+
+from .models import AuthorStats, Follow, Post, PulledAuthor, TimelineEntry
+from .paginator import Source, paginate_sources
+
+
+TIMELINE_ORDERING = ('-pub_date', '-post_id')
+BATCH_SIZE = 1000
+
+
+def entries_for(posts, user_id):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post.id, author_id=post.author_id, pub_date=post.pub_date)
+        for post in posts
+    ]
+
+
+def fan_out(post):
+    if PulledAuthor.objects.filter(author_id=post.author_id).exists():
+        return
+
+    followers = Follow.objects.filter(author_id=post.author_id)
+    followers_count = AuthorStats.objects.filter(pk=post.author_id).values_list('followers', flat=True).first()
+    if followers_count is None:
+        followers_count = followers.count()
+    if followers_count > settings.TIMELINE_FANOUT_LIMIT:
+        PulledAuthor.objects.get_or_create(author_id=post.author_id)
+        return
+
+    batch = []
+    for user_id in followers.values_list('user_id', flat=True).iterator():
+        batch.extend(entries_for([post], user_id))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def follow(user_id, author_id):
+    if PulledAuthor.objects.filter(author_id=author_id).exists():
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by('-pub_date', '-id')[:settings.TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(entries_for(posts, user_id), ignore_conflicts=True)
+
+
+def unfollow(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def refresh_pulled_authors():
+    heavy = Follow.objects.values('author').annotate(
+        followers=models.Count('user')
+    ).filter(followers__gt=settings.TIMELINE_FANOUT_LIMIT).values_list('author', flat=True)
+    PulledAuthor.objects.exclude(author__in=heavy).delete()
+    PulledAuthor.objects.bulk_create(
+        [PulledAuthor(author_id=author_id) for author_id in heavy], ignore_conflicts=True
+    )
+
+
+def rebuild(user_id):
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    posts = Post.objects.filter(
+        author__following__user_id=user_id
+    ).exclude(
+        author__pulled__isnull=False
+    ).order_by('-pub_date', '-id')[:settings.TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(entries_for(posts, user_id))
+
+
+def sources(user, columns=None):
+    """Источники ленты подписок user для paginate_sources.
+
+    Без columns строки — объекты Post, с columns — словари из .values()
+    с этими колонками поста (среди них должны быть pub_date и id).
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    if columns is None:
+        entries, transform = entries.select_related('post__author', 'post__group'), attrgetter('post')
+    else:
+        entries = entries.values('pub_date', 'post_id', *(f'post__{column}' for column in columns))
+
+        def transform(row):
+            return {column: row[f'post__{column}'] for column in columns}
+
+    result = [Source(entries, TIMELINE_ORDERING, transform)]
+
+    pulled = list(PulledAuthor.objects.filter(author__following__user=user).values_list('author_id', flat=True))
+    if pulled:
+        posts = Post.objects.filter(author_id__in=pulled)
+        result.append(Source(posts.select_related('author', 'group') if columns is None else posts.values(*columns)))
+
+    return result
+
+
+def feed(request, user, per_page):
+    return paginate_sources(request, sources(user), per_page)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 
 urlpatterns = [
@@ -10,6 +10,15 @@ urlpatterns = [
     path('group/<slug:slug>', views.group_posts, name='group'),
     path('new/', views.new_post, name='new_post'),
     path("follow/", views.follow_index, name="follow_index"),
+    path('search/', views.search, name='search'),
+    path('export/', views.export_dump, name='export'),
+    path('api/v1/search/', api.search, name='api_search'),
+    path('api/v1/posts/', api.index, name='api_index'),
+    path('api/v1/posts/<int:post_id>/', api.post, name='api_post'),
+    path('api/v1/posts/<int:post_id>/comments/', api.comments, name='api_comments'),
+    path('api/v1/groups/<slug:slug>/posts/', api.group, name='api_group'),
+    path('api/v1/users/<str:username>/posts/', api.profile, name='api_profile'),
+    path('api/v1/follow/', api.follow, name='api_follow'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path(
@@ -18,6 +27,7 @@ urlpatterns = [
         name='post_edit'
     ),
     path("<username>/<int:post_id>/comment", views.add_comment, name="add_comment"),
+    path('<str:username>/<int:post_id>/comments/', views.comments, name='comments'),
     path("<str:username>/follow/", views.profile_follow, name="profile_follow"),
     path("<str:username>/unfollow/", views.profile_unfollow, name="profile_unfollow"),
 ]
@@ -1,30 +1,47 @@
 from django.shortcuts import get_object_or_404, render, redirect
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db import IntegrityError
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition
 
+from . import comments as post_comments, export, search as post_search, stats, thumbnails, timeline
+from .cache import feed_cache_context
+from .conditional import feed_etag, feed_last_modified, post_etag, post_last_modified
 from .forms import PostForm, CommentForm
 from .models import Post, Group, Follow
+from .paginator import paginate
 from users.forms import User
 
 
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
 def index(request):
-    latest = Post.objects.select_related('group', 'author').prefetch_related('comments').all()
-    paginator = Paginator(latest, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    latest = Post.objects.select_related('group', 'author').all()
+    paginator, page = paginate(request, latest, 10)
+    thumbnails.attach(page)
 
-    return render(request, "index.html", {'page': page, 'paginator': paginator})
+    return render(request, "index.html", {'page': page, 'paginator': paginator, **feed_cache_context()})
 
 
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
 def group_posts(request, slug):
-    group = get_object_or_404(Group.objects.prefetch_related('posts'), slug=slug)
-    posts = group.posts.select_related('author').all()
-    paginator = Paginator(posts, 4)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    group = get_object_or_404(Group, slug=slug)
+    posts = group.posts.select_related('author', 'group')
+    paginator, page = paginate(request, posts, 4)
+    thumbnails.attach(page)
 
-    return render(request, "group.html", {"group": group, 'page': page, 'paginator': paginator})
+    return render(
+        request, "group.html",
+        {"group": group, 'page': page, 'paginator': paginator, **feed_cache_context()}
+    )
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator, page = post_search.paginate(request, query, 10) if query else (None, None)
+    if page is not None:
+        thumbnails.attach(page)
+
+    return render(request, 'search.html', {'query': query, 'page': page, 'paginator': paginator})
 
 
 @login_required
@@ -36,41 +53,73 @@ def new_post(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            thumbnails.schedule(post)
 
         return redirect('index')
 
     return render(request, "new_post.html", {'form': form, 'title': title})
 
 
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
 def profile(request, username):
-    author = get_object_or_404(User.objects.prefetch_related('posts'), username=username)
-    posts = author.posts.all()
-    paginator = Paginator(posts, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    author = get_object_or_404(User.objects.select_related('stats'), username=username)
+    posts = author.posts.select_related('author', 'group')
+    paginator, page = paginate(request, posts, 5)
+    thumbnails.attach(page)
 
     following = (Follow.objects.filter(user=request.user, author=author).exists()
                  if request.user.is_authenticated else False)
 
     return render(
         request, 'profile.html',
-        {'author': author, 'page': page, 'paginator': paginator, 'following': following}
+        {
+            'author': author, 'stats': stats.for_user(author), 'page': page, 'paginator': paginator,
+            'following': following, **feed_cache_context()
+        }
     )
 
 
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
 def post_view(request, username, post_id):
     post = get_object_or_404(
-        Post.objects.prefetch_related(
-            'comments', 'comments__author'
-        ).select_related('author'),
+        Post.objects.select_related('author__stats', 'group', 'thumbnail'),
         id=post_id,
         author__username=username
     )
+    return render_post(request, post, CommentForm())
+
+
+def render_post(request, post, form):
     author = post.author
-    comments = post.comments.all()
-    form = CommentForm()
+    comments, comments_cursor = post_comments.first_page(post)
 
-    return render(request, 'post.html', {'author': author, 'post': post, 'comments': comments, 'form': form})
+    return render(
+        request, 'post.html',
+        {
+            'author': author, 'stats': stats.for_user(author), 'post': post,
+            'comments': comments, 'comments_cursor': comments_cursor, 'form': form,
+        }
+    )
+
+
+def comments(request, username, post_id):
+    get_object_or_404(Post.objects.only('id'), id=post_id, author__username=username)
+    rows, next_cursor = post_comments.after(post_id, request.GET.get('after'))
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [
+                {'id': comment.id, 'author': comment.author.username, 'text': comment.text, 'created': comment.created}
+                for comment in rows
+            ],
+            'next': next_cursor,
+        })
+
+    return render(
+        request, 'comment_list.html',
+        {'username': username, 'post_id': post_id, 'comments': rows, 'comments_cursor': next_cursor}
+    )
 
 
 @login_required
@@ -86,6 +135,8 @@ def post_edit(request, username, post_id):
 
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect(f'/{author.username}/{post.id}/')
 
     title = 'Редактировать запись'
@@ -109,39 +160,29 @@ def server_error(request):
 @login_required
 def add_comment(request, username, post_id):
     form = CommentForm(request.POST or None)
-    post = get_object_or_404(
-        Post.objects.prefetch_related(
-            'comments', 'comments__author'
-        ).select_related('author'),
-        id=post_id,
-        author__username=username
-    )
-    author = post.author
-    comments = post.comments.all()
 
-    if form.is_valid():
-        new_comment = form.save(commit=False)
-        new_comment.author = request.user
-        new_comment.post = post
-        new_comment.save()
-        form = CommentForm()
-    else:
-        return render(request, 'post.html', {'author': author, 'post': post, 'comments': comments, 'form': form})
+    if not form.is_valid():
+        post = get_object_or_404(
+            Post.objects.select_related('author__stats', 'group', 'thumbnail'),
+            id=post_id,
+            author__username=username
+        )
+        return render_post(request, post, form)
+
+    post = get_object_or_404(Post.objects.only('id'), id=post_id, author__username=username)
+    new_comment = form.save(commit=False)
+    new_comment.author = request.user
+    new_comment.post = post
+    new_comment.save()
 
     return redirect('post', username=username, post_id=post_id)
 
 
 @login_required
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
 def follow_index(request):
-    latest = Post.objects.filter(
-        author__following__user=request.user
-    ).select_related(
-        'group', 'author'
-    ).prefetch_related('comments')
-
-    paginator = Paginator(latest, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator, page = timeline.feed(request, request.user, 10)
+    thumbnails.attach(page)
 
     return render(request, 'follow.html', {'page': page, 'paginator': paginator})
 
@@ -152,10 +193,7 @@ def profile_follow(request, username):
     following = get_object_or_404(User, username=username)
 
     if follower != following:
-        try:
-            Follow.objects.create(user=follower, author=following)
-        except IntegrityError:
-            redirect('profile', username=username)
+        Follow.objects.get_or_create(user=follower, author=following)
 
     return redirect('profile', username=username)
 
@@ -164,6 +202,24 @@ def profile_follow(request, username):
 def profile_unfollow(request, username):
     follower = request.user
     following = get_object_or_404(User, username=username)
-    Follow.objects.get(user=follower, author=following).delete()
+    Follow.objects.filter(user=follower, author=following).delete()
 
     return redirect('profile', username=username)
+
+
+@staff_member_required
+def export_dump(request):
+    tables = export.parse_tables(request.GET.get('tables'))
+    data_format = request.GET.get('format', 'jsonl')
+    if tables is None or data_format not in ('jsonl', 'csv'):
+        return HttpResponseBadRequest('Неизвестная таблица или формат')
+
+    parts = export.encode(tables, data_format)
+    filename = f'yatube.{data_format}'
+    content_type = 'text/csv' if data_format == 'csv' else 'application/x-ndjson'
+    if request.GET.get('gzip'):
+        parts, filename, content_type = export.gzipped(parts), f'{filename}.gz', 'application/gzip'
+
+    response = StreamingHttpResponse(parts, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,215 @@
+"""Метрики запроса: SQL, кэш, шаблоны и миниатюры.
+
+Счётчики копятся в объекте Metrics текущего запроса (contextvar), их
+заполняют обёртка execute_wrapper, подклассы кэша, шаблонного движка и
+бэкенда sorl. Вне запроса, например в фоновом пуле миниатюр, метрик нет
+и обёртки ничего не делают.
+"""
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache.backends.base import BaseCache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+from django.urls import Resolver404, resolve
+from sorl.thumbnail.base import ThumbnailBackend
+
+from . import metrics as node_metrics, slow_queries
+from .tiered_cache import TwoTierCache
+
+
+logger = logging.getLogger('yatube.requests')
+
+current = ContextVar('request_metrics', default=None)
+
+TIMERS = ('sql', 'template', 'thumbnail')
+# Префикс ключей django.core.cache.utils.make_template_fragment_key.
+FRAGMENT_PREFIX = 'template.cache.'
+MISSING = object()
+
+
+class Metrics:
+    def __init__(self, request=None):
+        self.request = request
+        self.tracking = True
+        self.queries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+        self.timings = dict.fromkeys(TIMERS, 0.0)
+        self.depth = dict.fromkeys(TIMERS, 0)
+
+    def execute(self, execute, sql, params, many, context):
+        if not self.tracking:
+            return execute(sql, params, many, context)
+        self.queries += 1
+        started = time.perf_counter()
+        with self.timer('sql'):
+            result = execute(sql, params, many, context)
+        duration = time.perf_counter() - started
+        if settings.SLOW_QUERY_MS is not None and duration * 1000 >= settings.SLOW_QUERY_MS:
+            slow_queries.report(self, sql, params, many, duration, context['connection'])
+        return result
+
+    @contextmanager
+    def untracked(self):
+        # Служебные запросы (EXPLAIN) не считаются и не проверяются на медленность.
+        self.tracking = False
+        try:
+            yield
+        finally:
+            self.tracking = True
+
+    def view(self):
+        return view_name(self.request) if self.request is not None else None
+
+    @contextmanager
+    def timer(self, name):
+        # Вложенные замеры (render_to_string внутри шаблона) не считаются дважды.
+        self.depth[name] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.depth[name] -= 1
+            if not self.depth[name]:
+                self.timings[name] += time.perf_counter() - started
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'sql;dur={self.timings["sql"] * 1000:.1f};desc="{self.queries} queries"',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'template;dur={self.timings["template"] * 1000:.1f}',
+            f'thumbnail;dur={self.timings["thumbnail"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            **{f'{name}_ms': round(value * 1000, 2) for name, value in self.timings.items()},
+        }
+
+
+@contextmanager
+def timer(name):
+    metrics = current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.timer(name):
+        yield
+
+
+def view_name(request):
+    # Ответ из кэша страниц возвращается до разбора адреса, тогда разбираем сами.
+    match = request.resolver_match
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+    return match.view_name
+
+
+class RequestMetricsMiddleware:
+    """Собирает метрики запроса в заголовок Server-Timing и строку лога.
+
+    Стоит первым, чтобы учитывать и ответы промежуточных слоёв, в том
+    числе кэша страниц.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = Metrics(request)
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        total = time.perf_counter() - started
+
+        view = view_name(request)
+        node_metrics.record_request(view, response.status_code, total, metrics, response.get('X-Page-Cache'))
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing(total)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 2),
+                **metrics.as_dict(),
+            }))
+        return response
+
+
+class CacheMetricsMixin:
+    """Считает попадания и промахи get и get_many.
+
+    Ключи тега {% cache %} дополнительно считаются как кэш фрагментов.
+    """
+
+    def count_request(self, key, hit):
+        metrics = current.get()
+        if metrics is not None:
+            metrics.cache_hits += hit
+            metrics.cache_misses += not hit
+            if str(key).startswith(FRAGMENT_PREFIX):
+                metrics.fragment_hits += hit
+                metrics.fragment_misses += not hit
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, MISSING, version)
+        self.count_request(key, value is not MISSING)
+        return default if value is MISSING else value
+
+    def get_many(self, keys, version=None):
+        found = super().get_many(keys, version)
+        # BaseCache.get_many ходит через get, там всё уже посчитано.
+        if super().get_many.__func__ is not BaseCache.get_many:
+            for key in keys:
+                self.count_request(key, key in found)
+        return found
+
+
+class InstrumentedTwoTierCache(CacheMetricsMixin, TwoTierCache):
+    pass
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timer('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class TimedThumbnailBackend(ThumbnailBackend):
+    def get_thumbnail(self, file_, geometry_string, **options):
+        with timer('thumbnail'):
+            return super().get_thumbnail(file_, geometry_string, **options)
@@ -0,0 +1,219 @@
+"""Метрики узла в формате Prometheus.
+
+Каждый процесс копит счётчики и гистограммы в памяти и не чаще раза в
+METRICS_FLUSH_INTERVAL секунд сбрасывает их в свой файл JSON в каталоге
+METRICS_DIR. Эндпоинт /metrics складывает файлы всех процессов, так что
+числа — итог по узлу, сколько бы воркеров WSGI ни было запущено.
+
+Файлы завершившихся процессов /metrics переносит в общий архив
+dead.json: каталог не растёт с перезапусками воркеров, а счётчики узла
+не уменьшаются.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+ARCHIVE = 'dead.json'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+DEFINITIONS = {
+    'yatube_requests_total': ('counter', 'Ответы по виду и коду'),
+    'yatube_request_duration_seconds': ('histogram', 'Время ответа по виду'),
+    'yatube_db_queries_total': ('counter', 'Запросы к базе по виду'),
+    'yatube_cache_requests_total': ('counter', 'Обращения к кэшу страниц и фрагментов: попадания и промахи'),
+    'yatube_cache_tier_requests_total': ('counter', 'Обращения к уровням кэша L1 (процесс) и L2 (общий)'),
+    'yatube_thumbnail_generation_seconds': ('histogram', 'Подготовка миниатюр одного поста'),
+}
+
+
+def label_key(labels):
+    return tuple(sorted((str(name), str(value)) for name, value in labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # После fork дочерний процесс начинает с нуля и пишет в свой файл.
+        self.pid = os.getpid()
+        self.started = time.time_ns()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed_at = 0
+
+    def check_fork(self):
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name, labels=None, value=1):
+        with self.lock:
+            self.check_fork()
+            self.counters[name, label_key(labels or {})] += value
+
+    def observe(self, name, value, labels=None):
+        with self.lock:
+            self.check_fork()
+            buckets = self.histograms.setdefault((name, label_key(labels or {})), [0] * len(BUCKETS) + [0, 0.0])
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+                    break
+            buckets[-2] += 1
+            buckets[-1] += value
+
+    def path(self):
+        return os.path.join(settings.METRICS_DIR, f'{self.pid}-{self.started}.json')
+
+    def flush(self, force=False):
+        with self.lock:
+            self.check_fork()
+            now = time.monotonic()
+            if not force and now - self.flushed_at < settings.METRICS_FLUSH_INTERVAL:
+                return
+            self.flushed_at = now
+            data = {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, values] for (name, labels), values in self.histograms.items()],
+            }
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = self.path()
+        with open(f'{path}.tmp', 'w') as stream:
+            json.dump(data, stream)
+        os.replace(f'{path}.tmp', path)
+
+
+registry = Registry()
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def load(path):
+    try:
+        with open(path) as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return None
+
+
+def merge(counters, histograms, data):
+    for name, labels, value in data['counters']:
+        counters[name, tuple(map(tuple, labels))] += value
+    for name, labels, values in data['histograms']:
+        total = histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(values))
+        for i, value in enumerate(values):
+            total[i] += value
+
+
+def filenames():
+    return [filename for filename in os.listdir(settings.METRICS_DIR) if filename.endswith('.json')]
+
+
+def prune():
+    """Переносит файлы завершившихся процессов в архив."""
+    dead = [
+        filename for filename in filenames()
+        if filename != ARCHIVE and filename.split('-', 1)[0].isdigit() and not alive(int(filename.split('-', 1)[0]))
+    ]
+    if not dead:
+        return
+    counters, histograms = defaultdict(float), {}
+    for filename in [ARCHIVE, *dead]:
+        data = load(os.path.join(settings.METRICS_DIR, filename))
+        if data is not None:
+            merge(counters, histograms, data)
+    path = os.path.join(settings.METRICS_DIR, ARCHIVE)
+    with open(f'{path}.tmp', 'w') as stream:
+        json.dump({
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+        }, stream)
+    os.replace(f'{path}.tmp', path)
+    for filename in dead:
+        os.remove(os.path.join(settings.METRICS_DIR, filename))
+
+
+def collect():
+    """Суммирует файлы всех процессов узла."""
+    registry.flush(force=True)
+    counters = defaultdict(float)
+    histograms = {}
+    # Блокировка не даёт двум процессам одновременно переносить файлы в архив
+    # и читать каталог посреди переноса.
+    with open(os.path.join(settings.METRICS_DIR, 'prune.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        prune()
+        for filename in filenames():
+            data = load(os.path.join(settings.METRICS_DIR, filename))
+            if data is not None:
+                merge(counters, histograms, data)
+    return counters, histograms
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def render(counters, histograms):
+    lines = []
+    for name, (kind, description) in DEFINITIONS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value:g}')
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", f"{bound:g}")])} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {values[-2]}')
+            lines.append(f'{name}_sum{format_labels(labels)} {values[-1]:g}')
+            lines.append(f'{name}_count{format_labels(labels)} {values[-2]}')
+    return '\n'.join(lines) + '\n'
+
+
+def record_request(view, status, duration, metrics, page_cache):
+    labels = {'view': view or 'unknown'}
+    registry.inc('yatube_requests_total', {**labels, 'status': status})
+    registry.observe('yatube_request_duration_seconds', duration, labels)
+    registry.inc('yatube_db_queries_total', labels, metrics.queries)
+    if page_cache in ('HIT', 'STALE', 'MISS'):
+        registry.inc('yatube_cache_requests_total', {'cache': 'page', 'result': page_cache.lower()})
+    for result, count in (('hit', metrics.fragment_hits), ('miss', metrics.fragment_misses)):
+        if count:
+            registry.inc('yatube_cache_requests_total', {'cache': 'fragment', 'result': result}, count)
+    registry.flush()
+
+
+def metrics_view(request):
+    allowed = settings.METRICS_ALLOWED_IPS
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render(*collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,129 @@
+"""Чтение с реплик и запись в основную базу.
+
+Безопасные запросы (GET, HEAD) к видам из REPLICA_VIEW_MODULES читают
+со случайной реплики из DATABASE_REPLICAS, всё остальное идёт в
+'default'. Запрос, который что-то записал, ставит cookie
+REPLICA_STICKY_COOKIE на REPLICA_STICKY_SECONDS: пока она жива, клиент
+читает с основной базы и видит свой пост сразу после перенаправления,
+даже если реплика ещё не догнала.
+
+Другие клиенты cookie не получают, а лента, собранная ими с отстающей
+реплики, попала бы в кэш страниц и ETag под новым поколением и жила бы
+до следующей записи. Поэтому им достаются только реплики, которые
+sync_replica скопировала после последнего сброса поколения 'page';
+пока таких нет, запрос читает с основной базы.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import Resolver404, resolve
+
+from posts.cache import generation_key
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+state = ContextVar('replica_state', default=None)
+
+
+class State:
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.wrote = False
+
+
+def synced_key(alias):
+    return f'yatube:replica:{alias}:synced'
+
+
+def mark_synced(alias, moment):
+    """Запоминает, что реплика alias содержит все записи до moment."""
+    caches['shared'].set(synced_key(alias), moment, None)
+
+
+def settled():
+    """Реплики, которые уже догнали последнюю запись.
+
+    Отметки sync_replica и время сброса поколения читаются прямо из L2:
+    в L1 процесса они могли устареть, а разница между ними и есть
+    измеренное отставание реплики.
+    """
+    changed = f'{generation_key("page")}:changed'
+    known = caches['shared'].get_many([changed, *map(synced_key, settings.DATABASE_REPLICAS)])
+    moment = known.get(changed, 0)
+    return [
+        alias for alias in settings.DATABASE_REPLICAS
+        if known.get(synced_key(alias), -1) >= moment
+    ]
+
+
+def pick(replicas):
+    return random.choice(replicas)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        current = state.get()
+        # После записи (и select_for_update, который идёт как запись) запрос
+        # читает с основной базы то, что сам записал.
+        if current is None or not current.replicas or current.wrote:
+            return DEFAULT_DB_ALIAS
+        return pick(current.replicas)
+
+    def db_for_write(self, model, **hints):
+        current = state.get()
+        if current is not None:
+            current.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, связи между ними допустимы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему на реплики переносит sync_replica вместе с данными.
+        return db == DEFAULT_DB_ALIAS
+
+
+def replica_view(request):
+    try:
+        func = resolve(request.path_info).func
+    except Resolver404:
+        return False
+    return getattr(func, '__module__', None) in settings.REPLICA_VIEW_MODULES
+
+
+class ReplicaMiddleware:
+    """Решает, можно ли запросу читать с реплики, и ставит cookie после записи.
+
+    Стоит до SessionMiddleware, чтобы сохранение сессии при входе тоже
+    считалось записью.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        allowed = (
+            request.method in SAFE_METHODS
+            and settings.REPLICA_STICKY_COOKIE not in request.COOKIES
+            and replica_view(request)
+        )
+        current = State(settled() if allowed else [])
+        token = state.set(current)
+        try:
+            response = self.get_response(request)
+        finally:
+            state.reset(token)
+
+        if current.wrote:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True
+            )
+        return response
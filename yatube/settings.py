@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -36,7 +37,7 @@ ALLOWED_HOSTS = [
 
 INSTALLED_APPS = [
     'users',
-    'posts',
+    'posts.apps.PostsConfig',
     'django.contrib.sites',
     'django.contrib.flatpages',
     'django.contrib.admin',
@@ -49,12 +50,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.instrumentation.RequestMetricsMiddleware',
+    'yatube.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'posts.profiler.ProfilerMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -63,7 +69,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'yatube.instrumentation.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -91,6 +97,25 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: пути к файлам SQLite через запятую в YATUBE_DB_REPLICAS,
+# например db-replica.sqlite3. Локально реплику держит в актуальном
+# состоянии команда sync_replica --interval; пока она не скопировала базу
+# после последней записи, чтения идут в основную. В тестах реплика — зеркало
+# тестовой базы default, а тесты маршрутизации подменяют replicas.pick.
+for number, name in enumerate(filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, name.strip()),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['yatube.replicas.ReplicaRouter']
+# Виды, которые при GET и HEAD читают с реплик.
+REPLICA_VIEW_MODULES = ('posts.views', 'posts.api')
+# Сколько секунд после записи клиент читает с основной базы: запас на отставание реплики.
+REPLICA_STICKY_COOKIE = 'yatube_primary'
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -145,8 +170,122 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
 
+# Кэш двухуровневый (yatube/tiered_cache.py): LRU в каждом процессе поверх
+# общего для воркеров L2. Чужие сбросы поколений доходят до процесса за
+# SYNC_INTERVAL секунд. На add и incr L2 держатся блокировки пересчёта,
+# ограничение частоты профилей и счётчики поколений, поэтому они должны быть
+# атомарны между процессами. По умолчанию L2 — файл SQLite
+# (yatube/sqlite_cache.py, путь в YATUBE_CACHE_FILE), общий для воркеров
+# одного узла; для нескольких узлов — memcached (YATUBE_MEMCACHED, например
+# 127.0.0.1:11211).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.instrumentation.InstrumentedTwoTierCache',
+        'OPTIONS': {'L2': 'shared', 'MAX_ENTRIES': 1000, 'SYNC_INTERVAL': 1, 'L1_TIMEOUT': 60},
+    },
+    'shared': {
+        'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+        'LOCATION': os.environ.get('YATUBE_CACHE_FILE', os.path.join(tempfile.gettempdir(), 'yatube-cache.sqlite3')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+if os.environ.get('YATUBE_MEMCACHED'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ['YATUBE_MEMCACHED'].split(','),
     }
+
+# Timeline
+
+# Авторы, у которых подписчиков больше этого числа, не раскладываются по лентам
+# при публикации: их посты подмешиваются в ленту при чтении.
+TIMELINE_FANOUT_LIMIT = 1000
+# Сколько последних постов переносится в ленту при подписке и пересборке.
+TIMELINE_BACKFILL = 1000
+
+# Cache
+
+# Фрагменты лент сбрасываются сменой поколения при изменении постов и
+# комментариев, поэтому срок жизни может быть большим.
+FEED_CACHE_TIMEOUT = 60 * 60
+# Страницы целиком для анонимных читателей; сбрасываются так же, сигналами.
+PAGE_CACHE_TIMEOUT = 60 * 10
+# Защита от лавины пересчётов (posts.cache.fetch): блокировка пересчёта живёт
+# не дольше CACHE_LOCK_TIMEOUT секунд; прежние значения отдаются, пока другой
+# воркер считает новое, и хранятся на CACHE_STALE_TIMEOUT секунд дольше срока.
+# CACHE_EARLY_BETA > 1 обновляет ключи раньше, 0 выключает досрочный пересчёт.
+CACHE_LOCK_TIMEOUT = 10
+CACHE_STALE_TIMEOUT = 60
+CACHE_EARLY_BETA = 1.0
+# Карточки постов: ключ меняется вместе с постом, так что хранить их можно долго.
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Thumbnails
+
+# Потоки пула внутри веб-процесса, готовящего миниатюры после сохранения
+# поста (YATUBE_THUMBNAIL_WORKERS, например 2). По умолчанию 0 — миниатюры
+# готовятся сразу в обработчике запроса: потоки пула переживают запрос и
+# транзакцию, в которой пост создан.
+THUMBNAIL_WORKERS = int(os.environ.get('YATUBE_THUMBNAIL_WORKERS', 0))
+
+# Comments
+
+# Комментарии на странице поста и в каждой догружаемой порции.
+COMMENTS_PER_PAGE = 50
+
+# API
+
+# Размер страницы API по умолчанию и наибольший, который можно запросить через ?limit=.
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Instrumentation
+
+# Заголовок Server-Timing с метриками запроса: SQL, кэш, шаблоны, миниатюры.
+SERVER_TIMING = True
+THUMBNAIL_BACKEND = 'yatube.instrumentation.TimedThumbnailBackend'
+# Запросы дольше стольких миллисекунд пишутся в yatube.slow_queries с планом
+# EXPLAIN; None выключает журнал. Одинаковые по форме запросы попадают в лог
+# не чаще раза в SLOW_QUERY_LOG_INTERVAL секунд.
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG_INTERVAL = 60 * 5
+
+# Каталог, куда процессы узла сбрасывают свои метрики для /metrics. Общий для
+# всех воркеров узла; очищайте его при перезапуске сервиса.
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'yatube-metrics')
+METRICS_FLUSH_INTERVAL = 5
+# Адреса, которым отдаётся /metrics; None — всем.
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# Строка JSON на каждый запрос пишется в логгер yatube.requests с уровнем INFO;
+# при DEBUG её не видно, метрики есть в Server-Timing.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING' if DEBUG else 'INFO',
+            'propagate': False,
+        },
+        'yatube.slow_queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
+
+# Profiler
+
+# Сотрудник может снять профиль одного запроса (см. posts/profiler.py). Профилей
+# не больше одного за PROFILER_RATE_LIMIT секунд; счётчик лежит в кэше default.
+PROFILER_RATE_LIMIT = 60
+# Срок действия токенов для заголовка X-Yatube-Profile из команды profile_token.
+PROFILER_TOKEN_MAX_AGE = 60 * 60
+PROFILER_SAMPLE_INTERVAL = 0.005
+# Сколько строк отчёта показывать в админке; файл профиля хранится целиком.
+PROFILER_REPORT_LINES = 40
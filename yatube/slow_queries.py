@@ -0,0 +1,118 @@
+"""Журнал медленных запросов.
+
+Запрос дольше SLOW_QUERY_MS пишется в логгер yatube.slow_queries вместе
+с параметрами, видом, строкой шаблона и планом EXPLAIN. Запросы одной
+формы (без учёта параметров, длины списков IN и LIMIT) попадают в лог не
+чаще раза в SLOW_QUERY_LOG_INTERVAL секунд на процесс, остальные только
+считаются.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.template.base import Node
+
+
+logger = logging.getLogger('yatube.slow_queries')
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+NUMBER = re.compile(r'\b(LIMIT|OFFSET) \d+')
+MAX_SHAPES = 1000
+MAX_PARAM_LENGTH = 200
+# Кадры самого журнала и обёртки метрик при поиске строки кода пропускаются.
+OWN_FILES = {__file__, os.path.join(os.path.dirname(__file__), 'instrumentation.py')}
+
+
+def shape(sql):
+    return NUMBER.sub(r'\1 ?', IN_LIST.sub('IN (...)', sql))
+
+
+class Sampler:
+    """Помнит, когда форма запроса последний раз попала в лог, и сколько раз её пропустили."""
+
+    def __init__(self, size=MAX_SHAPES):
+        self.size = size
+        self.seen = OrderedDict()
+        self.lock = threading.Lock()
+
+    def sample(self, key, interval):
+        """Возвращает число пропущенных повторов, если пора писать в лог, иначе None."""
+        now = time.monotonic()
+        with self.lock:
+            logged_at, skipped = self.seen.pop(key, (None, 0))
+            if logged_at is not None and now - logged_at < interval:
+                self.seen[key] = (logged_at, skipped + 1)
+                return None
+            self.seen[key] = (now, 0)
+            while len(self.seen) > self.size:
+                self.seen.popitem(last=False)
+            return skipped
+
+
+sampler = Sampler()
+
+
+def template_position():
+    """Шаблон и строка узла, который сейчас выводится, если запрос идёт из шаблона."""
+    frame = sys._getframe()
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        if isinstance(node, Node) and getattr(node, 'token', None) is not None and node.origin:
+            return f'{node.origin.template_name or node.origin.name}:{node.token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+def source_position():
+    """Ближайшая к запросу строка кода проекта."""
+    frame = sys._getframe()
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(settings.BASE_DIR) and filename not in OWN_FILES and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, settings.BASE_DIR)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return None
+
+
+def explain(connection, sql, params):
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        # Точка сохранения: упавший EXPLAIN не должен испортить транзакцию запроса.
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+    except Exception as error:
+        return [f'EXPLAIN не удался: {error}']
+
+
+def printable(params):
+    return [value if len(repr(value)) <= MAX_PARAM_LENGTH else f'{repr(value)[:MAX_PARAM_LENGTH]}…' for value in params]
+
+
+def report(metrics, sql, params, many, duration, connection):
+    skipped = sampler.sample(shape(sql), settings.SLOW_QUERY_LOG_INTERVAL)
+    if skipped is None:
+        return
+    if many:
+        params = params[0] if params else ()
+    params = list(params or ())
+    with metrics.untracked():
+        plan = None if many else explain(connection, sql, params)
+    logger.warning(json.dumps({
+        'duration_ms': round(duration * 1000, 2),
+        'view': metrics.view(),
+        'template': template_position(),
+        'source': source_position(),
+        'sql': sql,
+        'params': printable(params),
+        'plan': plan,
+        'skipped': skipped,
+    }, ensure_ascii=False, default=str))
@@ -0,0 +1,165 @@
+"""Кэш в файле SQLite, общий для всех процессов узла.
+
+Замена memcached там, где его нет: add и incr атомарны между процессами,
+потому что каждая из этих операций — одна транзакция SQLite, а SQLite
+пропускает писателей по одному. На add держатся блокировки пересчёта и
+ограничение частоты профилей, на incr — поколения кэша.
+
+Целые числа хранятся как есть, чтобы incr складывал их в самой базе,
+остальные значения — в pickle. Каждый поток и каждый процесс после fork
+открывает своё соединение.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+LIVE = '(expires IS NULL OR expires > ?)'
+INTEGER_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def encode(value):
+    if type(value) is int and value in INTEGER_RANGE:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def decode(value):
+    return pickle.loads(value) if isinstance(value, bytes) else value
+
+
+class SQLiteCache(BaseCache):
+    """Бэкенд кэша: LOCATION — путь к файлу базы.
+
+    OPTIONS: MAX_ENTRIES и CULL_FREQUENCY — как у встроенных бэкендов,
+    BUSY_TIMEOUT — сколько секунд ждать, пока пишет другой процесс.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self.busy_timeout = params.get('OPTIONS', {}).get('BUSY_TIMEOUT', 5)
+        self.local = threading.local()
+
+    @property
+    def db(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+            for statement in SCHEMA:
+                db.execute(statement)
+            self.local.db, self.local.pid = db, os.getpid()
+        return self.local.db
+
+    def key(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        row = self.db.execute(
+            f'SELECT value FROM cache WHERE key = ? AND {LIVE}', [self.key(key, version), time.time()]
+        ).fetchone()
+        return default if row is None else decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.key(key, version): key for key in keys}
+        found = {}
+        names = list(keys)
+        # Ограничение SQLite на число параметров в запросе.
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            rows = self.db.execute(
+                f'SELECT key, value FROM cache WHERE key IN ({", ".join("?" * len(chunk))}) AND {LIVE}',
+                [*chunk, time.time()],
+            )
+            found.update((keys[name], decode(value)) for name, value in rows)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.db.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            [self.key(key, version), encode(value), self.get_backend_timeout(timeout)],
+        )
+        self.cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Один оператор: вставка или замена только просроченного значения.
+        cursor = self.db.execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            [self.key(key, version), encode(value), self.get_backend_timeout(timeout), time.time()],
+        )
+        if cursor.rowcount:
+            self.cull()
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.key(key, version)
+        db = self.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = db.execute(
+                f"UPDATE cache SET value = value + ? WHERE key = ? AND {LIVE} AND typeof(value) = 'integer'",
+                [delta, key, time.time()],
+            )
+            if not cursor.rowcount:
+                raise ValueError(f"Key '{key}' not found")
+            value = db.execute('SELECT value FROM cache WHERE key = ?', [key]).fetchone()[0]
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self.db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {LIVE}',
+            [self.get_backend_timeout(timeout), self.key(key, version), time.time()],
+        )
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        row = self.db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {LIVE}', [self.key(key, version), time.time()]
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self.db.execute('DELETE FROM cache WHERE key = ?', [self.key(key, version)])
+
+    def delete_many(self, keys, version=None):
+        self.db.executemany('DELETE FROM cache WHERE key = ?', [[self.key(key, version)] for key in keys])
+
+    def clear(self):
+        self.db.execute('DELETE FROM cache')
+
+    def cull(self):
+        db = self.db
+        if db.execute('SELECT COUNT(*) FROM cache').fetchone()[0] <= self._max_entries:
+            return
+        db.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', [time.time()])
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if not self._cull_frequency:
+            db.execute('DELETE FROM cache')
+        else:
+            # Как у встроенных бэкендов: выбрасываем долю записей, раньше всех истекающих.
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                [count // self._cull_frequency],
+            )
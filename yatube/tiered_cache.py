@@ -0,0 +1,230 @@
+"""Двухуровневый кэш: небольшой LRU в памяти процесса поверх общего кэша.
+
+Первый уровень (L1) свой у каждого процесса и общий для его потоков, как
+у LocMemCache. Второй (L2) — отдельный псевдоним из CACHES, общий для
+всех воркеров: файл SQLite (yatube/sqlite_cache.py) или memcached.
+Чтения идут сначала в L1, промахи — в L2 с заполнением L1. Записи идут
+в оба уровня.
+
+Изменения, которые должны дойти до других процессов (incr — им сбрасывают
+поколения, delete, clear), увеличивают счётчик-эпоху в L2. Раз в
+SYNC_INTERVAL секунд процесс сверяет эпоху и при расхождении очищает свой
+L1, так что чужие сбросы видны не позже чем через SYNC_INTERVAL. Запись
+set по уже существующему ключу эпоху не трогает: такие значения
+в чужих L1 живут не дольше L1_TIMEOUT.
+
+add и incr выполняет L2, и атомарны они ровно настолько, насколько
+атомарен L2: в SQLiteCache и memcached — между всеми процессами, в
+LocMemCache — только между потоками одного процесса, в FileBasedCache —
+никак (два воркера могут оба получить True от add или потерять одно из
+увеличений). Поэтому L2 — только SQLiteCache или memcached.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics as node_metrics
+
+
+EPOCH_KEY = 'yatube:cache:epoch'
+MISSING = object()
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """LRU процесса: ключ → (срок по monotonic, значение в pickle)."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.epoch = None
+        self.synced_at = None
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return MISSING
+            expires, data = item
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value, expires, size):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (expires, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def local_tier(name):
+    with _tiers_lock:
+        return _tiers.setdefault(name, LocalTier())
+
+
+class TwoTierCache(BaseCache):
+    """Бэкенд кэша: L1 в процессе, L2 — псевдоним OPTIONS['L2'].
+
+    OPTIONS: L2 — псевдоним общего кэша, MAX_ENTRIES — размер L1,
+    SYNC_INTERVAL — как часто сверять эпоху, L1_TIMEOUT — наибольший срок
+    жизни значения в L1.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options.get('L2', 'shared')
+        self.sync_interval = options.get('SYNC_INTERVAL', 1)
+        self.l1_timeout = options.get('L1_TIMEOUT', 60)
+        self.tier = local_tier(location)
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def count_tier(self, tier, hit, number=1):
+        if number:
+            labels = {'tier': tier, 'result': 'hit' if hit else 'miss'}
+            node_metrics.registry.inc('yatube_cache_tier_requests_total', labels, number)
+
+    def l1_expires(self, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        timeout = self.l1_timeout if timeout is None else min(timeout, self.l1_timeout)
+        return time.monotonic() + timeout if timeout > 0 else None
+
+    def remember(self, key, value, timeout=DEFAULT_TIMEOUT):
+        expires = self.l1_expires(timeout)
+        if expires is None:
+            self.tier.delete(key)
+        else:
+            self.tier.set(key, value, expires, self._max_entries)
+
+    def sync(self):
+        now = time.monotonic()
+        if self.tier.synced_at is not None and now - self.tier.synced_at < self.sync_interval:
+            return
+        epoch = self.l2.get(EPOCH_KEY)
+        if epoch is None:
+            # Начальная эпоха от времени, как и поколения: после потери ключа
+            # в L2 старое значение не совпадёт с новым.
+            self.l2.add(EPOCH_KEY, time.time_ns(), None)
+            epoch = self.l2.get(EPOCH_KEY)
+        with self.tier.lock:
+            if epoch != self.tier.epoch:
+                self.tier.entries.clear()
+                self.tier.epoch = epoch
+            self.tier.synced_at = now
+
+    def broadcast(self):
+        try:
+            self.l2.incr(EPOCH_KEY)
+        except ValueError:
+            self.l2.set(EPOCH_KEY, time.time_ns(), None)
+
+    def get(self, key, default=None, version=None):
+        self.sync()
+        local_key = self.make_key(key, version)
+        value = self.tier.get(local_key)
+        self.count_tier('l1', value is not MISSING)
+        if value is not MISSING:
+            return value
+        value = self.l2.get(key, MISSING, version)
+        self.count_tier('l2', value is not MISSING)
+        if value is MISSING:
+            return default
+        self.remember(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        """Промахи L1 добираются из L2 одним get_many."""
+        self.sync()
+        found, missed = {}, []
+        for key in keys:
+            value = self.tier.get(self.make_key(key, version))
+            if value is MISSING:
+                missed.append(key)
+            else:
+                found[key] = value
+        self.count_tier('l1', True, len(found))
+        self.count_tier('l1', False, len(missed))
+        if missed:
+            fetched = self.l2.get_many(missed, version)
+            self.count_tier('l2', True, len(fetched))
+            self.count_tier('l2', False, len(missed) - len(fetched))
+            for key, value in fetched.items():
+                self.remember(self.make_key(key, version), value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        self.remember(self.make_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self.remember(self.make_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Блокировки и ограничения частоты держатся на add, а он атомарен лишь
+        # настолько, насколько атомарен L2 (см. описание модуля).
+        if not self.l2.add(key, value, timeout, version):
+            return False
+        self.remember(self.make_key(key, version), value, timeout)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        try:
+            value = self.l2.incr(key, delta, version)
+        except ValueError:
+            # Ключ вытеснен из L2, а в чужих L1 может жить прежнее значение.
+            self.tier.delete(self.make_key(key, version))
+            self.broadcast()
+            raise
+        self.remember(self.make_key(key, version), value, None)
+        self.broadcast()
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.tier.delete(self.make_key(key, version))
+        return self.l2.touch(key, timeout, version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version) is not MISSING
+
+    def delete(self, key, version=None):
+        self.l2.delete(key, version)
+        self.tier.delete(self.make_key(key, version))
+        self.broadcast()
+
+    def delete_many(self, keys, version=None):
+        self.l2.delete_many(keys, version)
+        for key in keys:
+            self.tier.delete(self.make_key(key, version))
+        self.broadcast()
+
+    def clear(self):
+        self.l2.clear()
+        self.tier.clear()
+        self.broadcast()